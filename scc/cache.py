@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+On-disk storage shared between scc runs.
+
+Environment variables:
+    SCC_CACHE_DIR       default: ~/.scc/cache
+    SCC_CACHE_SIZE      default: 50 (MB)
+
+"""
+
+import os
+import time
+import json
+import uuid
+import logging
+import threading
+
+try:
+    from hashlib import sha1 as sha_new
+except ImportError:
+    from sha import new as sha_new
+
+
+SCC_CACHE_DIR = os.environ.get(
+    "SCC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".scc", "cache"))
+try:
+    SCC_CACHE_SIZE = int(os.environ.get("SCC_CACHE_SIZE")) * 1024 * 1024
+except:
+    SCC_CACHE_SIZE = 50 * 1024 * 1024
+
+
+class DiskCache(object):
+    """
+    Size-capped key/value store where each entry is a JSON file.
+
+    Entries are named after the sha1 of their key. Reading an entry
+    refreshes its modification time so that, once the total size exceeds
+    max_size, the least recently used entries are evicted first.
+    """
+
+    SUFFIX = ".json"
+
+    def __init__(self, path=SCC_CACHE_DIR, max_size=SCC_CACHE_SIZE):
+        self.log = logging.getLogger("scc.cache")
+        self.dbg = self.log.debug
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.RLock()
+        self.size = None
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def __repr__(self):
+        return "DiskCache: %s" % self.path
+
+    def get_filename(self, key):
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+        return os.path.join(self.path, sha_new(key).hexdigest() + self.SUFFIX)
+
+    def get(self, key, max_age=None):
+        """
+        Return the value stored under key or None if it is missing. If
+        max_age is set, entries older than max_age seconds are ignored.
+        """
+        filename = self.get_filename(key)
+        with self.lock:
+            try:
+                f = open(filename, "r")
+                try:
+                    entry = json.load(f)
+                finally:
+                    f.close()
+                if max_age is not None and \
+                        time.time() - entry["time"] > max_age:
+                    return None
+                os.utime(filename, None)
+                return entry["value"]
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                return None
+
+    def set(self, key, value):
+        """Store value under key and evict old entries if needed"""
+        filename = self.get_filename(key)
+        tmp_filename = "%s.%s.tmp" % (filename, uuid.uuid4().hex)
+        with self.lock:
+            try:
+                old_size = os.path.getsize(filename)
+            except OSError:
+                old_size = 0
+            f = open(tmp_filename, "w")
+            try:
+                json.dump({"time": time.time(), "value": value}, f)
+            finally:
+                f.close()
+            os.rename(tmp_filename, filename)
+            if self.size is not None:
+                self.size += os.path.getsize(filename) - old_size
+            self.evict()
+
+    def delete(self, key):
+        """Remove the entry stored under key if it exists"""
+        filename = self.get_filename(key)
+        with self.lock:
+            try:
+                size = os.path.getsize(filename)
+                os.remove(filename)
+            except OSError:
+                return
+            if self.size is not None:
+                self.size -= size
+
+    def list_entries(self):
+        """Return (mtime, size, filename) tuples for all entries"""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.SUFFIX):
+                continue
+            filename = os.path.join(self.path, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until under max_size"""
+        with self.lock:
+            if self.size is None:
+                self.size = sum(x[1] for x in self.list_entries())
+            if self.size <= self.max_size:
+                return
+
+            for mtime, size, filename in sorted(self.list_entries()):
+                if self.size <= self.max_size:
+                    break
+                try:
+                    os.remove(filename)
+                except OSError:
+                    continue
+                self.dbg("Evicted %s", filename)
+                self.size -= size
+
+    def clear(self):
+        """Remove all entries"""
+        with self.lock:
+            for mtime, size, filename in self.list_entries():
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+            self.size = 0
@@ -23,14 +23,23 @@
 import re
 import os
 import sys
+import json
+import atexit
+import time
 import uuid
 import subprocess
 import logging
 import threading
-import difflib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import socket
+from datetime import datetime
 from ssl import SSLError
 from framework import Command, Stop
+from cache import DiskCache
+from stats import RequestStats
+from transport import get_connection_classes, ConnectionPool, \
+    RequestScheduler
 
 github_loaded = True
 try:
@@ -63,6 +72,9 @@ try:
 except:
     SCC_RETRIES = 3
 GH_RETRY_CODES = [405, 502]
+GH_PER_PAGE = 100  # Maximum page size allowed by the GitHub API
+ORG_MEMBERS_MAX_AGE = 3600  # Lifetime of cached organization members
+STATUS_COST = 3  # Cost of the commit status stage of the filter pipeline
 
 
 def retry_on_error(retries=SCC_RETRIES):
@@ -81,7 +93,8 @@ def retry_on_error(retries=SCC_RETRIES):
                 try:
                     return func(*args, **kwargs)
                 except github.GithubException, e:
-                    if e.status not in GH_RETRY_CODES:
+                    if e.status not in GH_RETRY_CODES and \
+                            not is_rate_limited(e):
                         raise
                     error = "Received %s" % e.data
                 except socket.timeout:
@@ -90,11 +103,118 @@ def retry_on_error(retries=SCC_RETRIES):
                     error = "SSL error"
                 if num >= retries:
                     raise
-                log.debug("%s, retrying (try %s)", error, num + 1)
+                GHManager.stats.record_retry(func.__name__)
+                delay = GHManager.scheduler.get_retry_delay(num)
+                log.debug("%s, retrying in %.2fs (try %s)",
+                          error, delay, num + 1)
+                time.sleep(delay)
         return wrapper
     return decorator
 
 
+def is_rate_limited(e):
+    """Return True if a GithubException is caused by a rate limit"""
+    if e.status not in (403, 429):
+        return False
+    message = ""
+    if isinstance(e.data, dict):
+        message = e.data.get("message", "").lower()
+    return e.status == 429 or "rate limit" in message or "abuse" in message
+
+
+# git commands which never modify references or remotes
+READ_ONLY_COMMANDS = ["cat-file", "check-ref-format", "describe",
+                      "diff-index", "for-each-ref", "log", "merge-base",
+                      "merge-tree", "rev-list", "rev-parse", "show-ref",
+                      "status"]
+
+
+def is_read_only(command):
+    """
+    Return True if a git command line is known not to modify the
+    references or remotes of a repository.
+    """
+    if len(command) < 2 or command[0] != "git":
+        return False
+    if command[1] in READ_ONLY_COMMANDS:
+        return True
+    if command[1:] == ("remote",):
+        return True
+    if command[1] == "submodule":
+        return "status" in command or "foreach" in command
+    return False
+
+
+def parallel_map(func, items, jobs=1):
+    """
+    Return the list of func(item) for all items, using a pool of up to
+    jobs threads. The order of the results matches the order of the items
+    and the first exception raised by func is propagated.
+    """
+    items = list(items)
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def merge_commits(args):
+    """
+    Merge commits in memory one after the other on top of base in the
+    repository at path, with args being a (path, base, commits) tuple.
+
+    Return True if all merges are clean, False if one of them conflicts
+    and None if the merges cannot be computed. This function is run in
+    worker processes.
+    """
+    path, base, commits = args
+    for i, commit in enumerate(commits):
+        p = subprocess.Popen(
+            ["git", "merge-tree", "--write-tree", "--no-messages",
+             "--name-only", base, commit],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=path)
+        o, e = p.communicate()
+        tree = o.split("\n", 1)[0].strip()
+        if p.returncode not in (0, 1) or not tree:
+            return None
+        if p.returncode:
+            return False
+        if i == len(commits) - 1:
+            break
+        p = subprocess.Popen(
+            ["git", "commit-tree", tree, "-p", base, "-p", commit,
+             "-m", "Dry merge of %s" % commit],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=path)
+        o, e = p.communicate()
+        if p.returncode:
+            return None
+        base = o.strip()
+    return True
+
+
+def format_conflict_matrix(report):
+    """
+    Return the lines of a conflict matrix report. The diagonal shows
+    whether each pull request merges on top of the base.
+    """
+    lines = ["Conflict matrix of %s on %s (%s):" % (
+        report["repository"], report["base"], report["base_sha"][0:6])]
+    numbers = ["#%s" % x["number"] for x in report["pulls"]]
+    width = max([len(x) for x in numbers] + [1]) + 1
+    lines.append(" " * width + "".join(x.rjust(width) for x in numbers))
+    symbols = {True: ".", False: "X", None: "?"}
+    for number, row in zip(numbers, report["matrix"]):
+        lines.append(number.rjust(width) +
+                     "".join(symbols[x].rjust(width) for x in row))
+    lines.append("(.: clean, X: conflict, ?: unknown)")
+    return lines
+
+
 def hash_object(filename):
     """
     Returns the sha1 for this file using the
@@ -120,7 +240,13 @@ def hash_object(filename):
     return digest.hexdigest()
 
 
-def git_config(name, user=False, local=False, value=None, config_file=None):
+def git_config(name, user=False, local=False, value=None, config_file=None,
+               cwd=None):
+    """
+    Get or set a git configuration value. Relative paths, including the
+    configuration file, are resolved against cwd, which defaults to the
+    current working directory.
+    """
     dbg = logging.getLogger("scc.config").debug
     try:
         pre_cmd = ["git", "config"]
@@ -138,7 +264,8 @@ def git_config(name, user=False, local=False, value=None, config_file=None):
             pre_cmd.extend(["-f", config_file])
 
         p = subprocess.Popen(
-            pre_cmd + post_cmd, stdout=subprocess.PIPE).communicate()[0]
+            pre_cmd + post_cmd, stdout=subprocess.PIPE,
+            cwd=cwd).communicate()[0]
         value = p.split("\n")[0].strip()
         if value:
             dbg("Found %s", name)
@@ -184,16 +311,34 @@ class GHManager(object):
     """
     By setting dont_ask to true, it's possible to prevent the call
     to getpass.getpass. This is useful during unit tests.
+
+    By setting cache to true, GET responses are stored on disk and
+    revalidated using conditional requests in subsequent runs.
+
+    All requests, including those sent from worker threads, are paced by
+    the scheduler and sent over the keep-alive connections of the pool
+    shared between the GHManager instances. Their statistics are
+    collected by the shared stats.
     """
 
+    cache = None
+    scheduler = RequestScheduler()
+    pool = ConnectionPool()
+    stats = RequestStats()
+
     def __init__(self, login_or_token=None, password=None, dont_ask=False,
-                 user_agent='PyGithub'):
+                 user_agent='PyGithub', cache=False):
 
         self.log = logging.getLogger("scc.gh")
         self.dbg = self.log.debug
         self.login_or_token = login_or_token
         self.dont_ask = dont_ask
         self.user_agent = user_agent
+        self.public_members = {}
+        self.lock = threading.RLock()
+        self.cache = None
+        if cache:
+            self.cache = self.create_cache()
         try:
             self.authorize(password)
             if login_or_token or password:
@@ -252,23 +397,64 @@ class GHManager(object):
     def get_repo(self, *args):
         return self.github.get_repo(*args)
 
+    def create_cache(self):
+        """
+        Return the on-disk cache used for GitHub responses or None if it
+        cannot be created.
+        """
+        try:
+            return DiskCache()
+        except (IOError, OSError):
+            self.log.warn("Failed to create cache, disabling it", exc_info=1)
+            return None
+
     @retry_on_error(retries=SCC_RETRIES)
     def create_instance(self, *args, **kwargs):
         """
         Subclasses can override this method in order
         to prevent use of the pygithub2 library.
         """
+        # PyGithub connection classes are registered globally
+        github.Requester.Requester.injectConnectionClasses(
+            *get_connection_classes(self.cache, self.scheduler, self.pool,
+                                    self.stats))
         self.github = github.Github(*args, user_agent=self.user_agent,
-                                    **kwargs)
+                                    per_page=GH_PER_PAGE, **kwargs)
 
     @retry_on_error(retries=SCC_RETRIES)
     def __getattr__(self, key):
         self.dbg("github.%s", key)
         return getattr(self.github, key)
 
+    @retry_on_error(retries=SCC_RETRIES)
+    def fetch_public_members(self, org):
+        return [x.login for x in org.get_public_members()]
+
+    def get_public_members(self, org):
+        """
+        Return the set of logins of the public members of an organization.
+        Members are fetched once per run and stored in the on-disk cache
+        for ORG_MEMBERS_MAX_AGE seconds.
+        """
+        with self.lock:
+            if org.login not in self.public_members:
+                key = "public_members %s" % org.login
+                members = None
+                if self.cache is not None:
+                    members = self.cache.get(key, max_age=ORG_MEMBERS_MAX_AGE)
+                if members is None:
+                    members = self.fetch_public_members(org)
+                    if self.cache is not None:
+                        self.cache.set(key, members)
+                self.dbg("Found %s public members of %s",
+                         len(members), org.login)
+                self.public_members[org.login] = set(members)
+            return self.public_members[org.login]
+
     def get_rate_limiting(self):
         requests = self.github.rate_limiting
         self.dbg("Remaining requests: %s out of %s", requests[0], requests[1])
+        return requests
 
     def gh_repo(self, reponame, username=None):
         """
@@ -397,12 +583,23 @@ class LoggerWrapper(threading.Thread):
 
 
 class PullRequest(object):
-    def __init__(self, pull):
-        """Register the Pull Request and its corresponding Issue"""
+    def __init__(self, pull, label_index=None, comment_index=None):
+        """
+        Register the Pull Request and its corresponding Issue.
+
+        If specified, label_index is a dictionary of label names indexed by
+        issue number used in place of the Issue to retrieve labels and
+        comment_index is a CommentIndex used in place of the Issue to
+        retrieve comments.
+        """
         self.log = logging.getLogger("scc.pr")
         self.dbg = self.log.debug
 
         self.pull = pull
+        self.label_index = label_index
+        self.comment_index = comment_index
+        self._issue = None
+        self._comments = None
 
     def __contains__(self, key):
         return key in self.get_labels()
@@ -482,7 +679,9 @@ class PullRequest(object):
     @retry_on_error(retries=SCC_RETRIES)
     def get_issue(self):
         """Return the issue corresponding to the Pull Request."""
-        return self.pull.base.repo.get_issue(self.get_number())
+        if self._issue is None:
+            self._issue = self.pull.base.repo.get_issue(self.get_number())
+        return self._issue
 
     def get_head_login(self):
         """Return the login of the branch where the changes are implemented."""
@@ -503,6 +702,10 @@ class PullRequest(object):
         branch = getattr(self.pull, ref)
         return branch.repo.get_commit(self.get_sha())
 
+    def get_repo(self, ref="base"):
+        """Return the base or head repository of the Pull Request."""
+        return getattr(self.pull, ref).repo
+
     def get_base(self):
         """Return the branch against which the Pull Request is opened."""
         return self.pull.base.ref
@@ -510,22 +713,43 @@ class PullRequest(object):
     @retry_on_error(retries=SCC_RETRIES)
     def get_labels(self):
         """Return the labels of the Pull Request."""
+        if self.label_index is not None and \
+                self.get_number() in self.label_index:
+            return self.label_index[self.get_number()]
         return [x.name for x in self.get_issue().labels]
 
     @retry_on_error(retries=SCC_RETRIES)
+    def get_issue_comments(self):
+        """Return all the comments of the Pull Request."""
+        if self._comments is None:
+            if self.comment_index is not None:
+                self._comments = self.comment_index.get_comments(
+                    self.get_number())
+            elif self.get_issue().comments:
+                self._comments = list(self.get_issue().get_comments())
+            else:
+                self._comments = []
+        return self._comments
+
     def get_comments(self, whitelist=lambda x: True):
-        """Return the labels of the Pull Request."""
-        if self.get_issue().comments:
-            return [comment.body for comment in
-                    self.get_issue().get_comments() if whitelist(comment)]
-        else:
-            return []
+        """Return the bodies of the whitelisted comments."""
+        return [comment.body for comment in self.get_issue_comments()
+                if whitelist(comment)]
+
+    def invalidate(self):
+        """Discard the cached issue and comments of the Pull Request."""
+        self._issue = None
+        self._comments = None
+        if self.comment_index is not None:
+            self.comment_index.invalidate()
 
     @retry_on_error(retries=SCC_RETRIES)
     def create_issue_comment(self, msg):
         """Add comment to Pull Request"""
 
-        return self.pull.create_issue_comment(msg)
+        comment = self.pull.create_issue_comment(msg)
+        self.invalidate()
+        return comment
 
     @retry_on_error(retries=SCC_RETRIES)
     def edit_body(self, body):
@@ -549,6 +773,190 @@ class PullRequest(object):
             return None
 
 
+class CommentIndex(object):
+    """
+    Index of the issue comments of a GitHub repository by issue number.
+
+    The index is filled from the repository-level comments listing. Only
+    the comments updated since the most recent comment seen so far are
+    fetched when synchronizing again. The index and this high-water mark
+    are stored in a DiskCache and fully rebuilt after MAX_AGE seconds so
+    that deleted comments eventually disappear.
+    """
+
+    MAX_AGE = 24 * 3600
+    FIELDS = ["id", "url", "html_url", "issue_url", "body", "created_at",
+              "updated_at"]
+    USER_FIELDS = ["login", "id", "url", "type"]
+    DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+    def __init__(self, gh_repo, cache=None):
+        self.log = logging.getLogger("scc.comments")
+        self.dbg = self.log.debug
+        self.gh_repo = gh_repo
+        self.cache = cache
+        self.key = "comments %s/%s" % (gh_repo.user_name, gh_repo.repo_name)
+        self.lock = threading.RLock()
+        self.synced = False
+        self.load()
+
+    def load(self):
+        """Load the index from the cache"""
+        self.created = time.time()
+        self.since = None
+        self.comments = {}
+        if self.cache is None:
+            return
+
+        value = self.cache.get(self.key)
+        if value and time.time() - value["created"] < self.MAX_AGE:
+            self.created = value["created"]
+            self.since = value["since"]
+            self.comments = value["comments"]
+
+    def save(self):
+        """Store the index in the cache"""
+        if self.cache is None:
+            return
+
+        self.cache.set(self.key, {
+            "created": self.created, "since": self.since,
+            "comments": self.comments})
+
+    def invalidate(self):
+        """Fetch new comments on the next access"""
+        with self.lock:
+            self.synced = False
+
+    def trim(self, raw_data):
+        """Only keep the comment attributes used by scc"""
+        trimmed = dict((k, raw_data.get(k)) for k in self.FIELDS)
+        user = raw_data.get("user") or {}
+        trimmed["user"] = dict((k, user.get(k)) for k in self.USER_FIELDS)
+        return trimmed
+
+    @retry_on_error(retries=SCC_RETRIES)
+    def sync(self):
+        """Fetch the comments updated since the high-water mark"""
+        with self.lock:
+            if self.synced:
+                return
+
+            kwargs = {"sort": "updated", "direction": "asc"}
+            if self.since is not None:
+                kwargs["since"] = datetime.strptime(
+                    self.since, self.DATE_FORMAT)
+            since = self.since
+            count = 0
+            for comment in self.gh_repo.repo.get_issues_comments(**kwargs):
+                # raw_data would fetch each incomplete listed comment again
+                raw_data = self.trim(comment._rawData)
+                number = raw_data["issue_url"].rsplit("/", 1)[-1]
+                issue_comments = self.comments.setdefault(number, {})
+                issue_comments[str(raw_data["id"])] = raw_data
+                if since is None or raw_data["updated_at"] > since:
+                    since = raw_data["updated_at"]
+                count += 1
+
+            self.dbg("Fetched %s comments of %s since %s",
+                     count, self.gh_repo, self.since)
+            self.since = since
+            self.synced = True
+            if count:
+                self.save()
+
+    def get_comments(self, number):
+        """Return the comments of the issue sorted by creation"""
+        self.sync()
+        issue_comments = self.comments.get(str(number), {})
+        return [self.gh_repo.gh.create_from_raw_data(
+            github.IssueComment.IssueComment, issue_comments[x])
+            for x in sorted(issue_comments.keys(), key=int)]
+
+
+class StatusResolver(object):
+    """
+    Resolver of the combined commit status of Pull Requests.
+
+    The combined status endpoint returns the state of a commit in a single
+    request. States are cached by repository and SHA so that a commit
+    shared by several lookups, e.g. the base and head repositories of a
+    Pull Request opened from a branch of the same repository, is only
+    fetched once.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger("scc.status")
+        self.dbg = self.log.debug
+        self.states = {}
+        self.lock = threading.RLock()
+
+    def get_key(self, pullrequest, ref="base"):
+        """Return the (repository, SHA) pair of a status lookup or None"""
+        repo = pullrequest.get_repo(ref)
+        if repo is None:
+            # The head repository of a Pull Request may have been deleted
+            return None
+        return (repo, pullrequest.get_sha())
+
+    @retry_on_error(retries=SCC_RETRIES)
+    def fetch_state(self, repo, sha):
+        """Return the combined state of a commit or None without status"""
+        headers, data = repo._requester.requestJsonAndCheck(
+            "GET", "%s/commits/%s/status" % (repo.url, sha))
+        if not data.get("total_count"):
+            return None
+        return data["state"]
+
+    def get_state(self, key):
+        """Return the combined state of a (repository, SHA) pair"""
+        if key is None:
+            return None
+        repo, sha = key
+        cache_key = (repo.full_name, sha)
+        with self.lock:
+            if cache_key in self.states:
+                return self.states[cache_key]
+        state = self.fetch_state(repo, sha)
+        self.dbg("Status of %s in %s: %s", sha, repo.full_name, state)
+        with self.lock:
+            self.states[cache_key] = state
+        return state
+
+    def fetch_states(self, keys, jobs=1):
+        """Fetch the states of all distinct uncached keys"""
+        unique_keys = {}
+        with self.lock:
+            for key in keys:
+                if key is None:
+                    continue
+                cache_key = (key[0].full_name, key[1])
+                if cache_key not in self.states:
+                    unique_keys[cache_key] = key
+        parallel_map(self.get_state, unique_keys.values(), jobs)
+
+    def prefetch(self, pullrequests, jobs=1):
+        """
+        Resolve the states of a batch of Pull Requests. Head repositories
+        are only queried for the Pull Requests without a base status.
+        """
+        self.fetch_states([self.get_key(x, "base") for x in pullrequests],
+                          jobs)
+        self.fetch_states([self.get_key(x, "head") for x in pullrequests
+                           if self.get_state(self.get_key(x, "base")) is None],
+                          jobs)
+
+    def resolve(self, pullrequest):
+        """
+        Return the state of the head commit of a Pull Request on the base
+        repository, falling back on the head repository, or None.
+        """
+        state = self.get_state(self.get_key(pullrequest, "base"))
+        if state is None:
+            state = self.get_state(self.get_key(pullrequest, "head"))
+        return state
+
+
 class GitHubRepository(object):
 
     def __init__(self, gh, user_name, repo_name):
@@ -558,6 +966,9 @@ class GitHubRepository(object):
         self.user_name = user_name
         self.repo_name = repo_name
         self.candidate_pulls = []
+        self.label_index = None
+        self.comment_index = None
+        self.status_resolver = StatusResolver()
 
         try:
             self.repo = gh.get_repo(user_name + '/' + repo_name)
@@ -584,22 +995,62 @@ class GitHubRepository(object):
     def get_pulls(self, *args):
         return self.repo.get_pulls(*args)
 
+    def list_pulls(self, state="open", **parameters):
+        """
+        Return a paginated list of Pull Requests. The parameters, e.g.
+        base or head, are passed to the API to filter the Pull Requests
+        server-side.
+        """
+        parameters["state"] = state
+        return github.PaginatedList.PaginatedList(
+            github.PullRequest.PullRequest, self.repo._requester,
+            self.repo.url + "/pulls", parameters)
+
     @retry_on_error(retries=SCC_RETRIES)
     def get_pulls_by_base(self, base):
-        return [pull for pull in self.get_pulls()
+        return [pull for pull in self.list_pulls(base=base)
                 if (pull.base.ref == base)]
 
+    @retry_on_error(retries=SCC_RETRIES)
+    def get_pulls_by_head(self, user, branch):
+        return [pull for pull in
+                self.list_pulls(head="%s:%s" % (user, branch))
+                if (pull.head.ref == branch)]
+
     @retry_on_error(retries=SCC_RETRIES)
     def get_pull(self, *args):
         return self.repo.get_pull(*args)
 
+    @retry_on_error(retries=SCC_RETRIES)
+    def build_label_index(self):
+        """
+        Index the label names of all open issues, including Pull Requests,
+        by number using the paginated issues listing.
+        """
+        label_index = {}
+        for issue in self.repo.get_issues(state="open"):
+            label_index[issue.number] = [x.name for x in issue.labels]
+        self.dbg("Indexed labels of %s open issues", len(label_index))
+        self.label_index = label_index
+        return label_index
+
+    def get_comment_index(self):
+        """
+        Return the CommentIndex of the repository or None if the index
+        cannot be persisted, in which case listing comments per Pull
+        Request is cheaper.
+        """
+        if self.comment_index is None and self.gh.cache is not None:
+            self.comment_index = CommentIndex(self, self.gh.cache)
+        return self.comment_index
+
     def get_owner(self):
         return self.owner.login
 
     def is_whitelisted(self, user, default="org"):
         if default == "org":
             if self.org:
-                status = self.org.has_in_public_members(user)
+                status = user.login in self.gh.get_public_members(self.org)
             else:
                 status = False
         elif default == "mine":
@@ -661,87 +1112,252 @@ class GitHubRepository(object):
 
         return False, None
 
-    def find_candidates(self, filters):
-        """Find candidate Pull Requests for merging."""
-        self.dbg("## PRs found:")
-        msg = ""
+    def get_filter_pipeline(self, filters):
+        """
+        Compile the filters into a list of (cost, stage) tuples sorted by
+        increasing cost. Each stage takes a PullRequest and returns the
+        reason for excluding it or None. Stages of cost 0 only use the
+        attributes of the pull listing while higher costs require an
+        increasing number of GitHub requests.
+        """
 
-        # Fail fast if default is none and no include filter is specified
-        no_include = all(v is None for v in filters["include"].values())
-        if filters["default"] == 'none' and no_include:
-            return msg
+        def get_local_attributes(pullrequest):
+            return {"user": [pullrequest.get_login()],
+                    "pr": [str(pullrequest.get_number())]}
 
-        # Loop over pull requests opened aGainst base
-        pulls = self.get_pulls_by_base(filters["base"])
-        excluded_pulls = {}
-        is_whitelisted_comment = lambda x: self.is_whitelisted(
-            x.user, filters["default"])
+        def get_label_attributes(pullrequest):
+            return {"label": [x.lower() for x in pullrequest.get_labels()]}
 
-        for pull in pulls:
-            pullrequest = PullRequest(pull)
+        def exclude_local(pullrequest):
+            exclude, reason = self.run_filter(
+                filters["exclude"], get_local_attributes(pullrequest),
+                action="Exclude")
+            if exclude:
+                return reason
 
-            if pullrequest.parse('exclude', whitelist=is_whitelisted_comment):
-                excluded_pulls[pullrequest] = 'exclude comment'
-                continue
+        def exclude_label(pullrequest):
+            exclude, reason = self.run_filter(
+                filters["exclude"], get_label_attributes(pullrequest),
+                action="Exclude")
+            if exclude:
+                return reason
 
+        def check_whitelist(pullrequest):
             pullrequest_user = pullrequest.get_user()
-            pr_attributes = {}
-            pr_attributes["label"] = [x.lower() for x in
-                                      pullrequest.get_labels()]
-            pr_attributes["user"] = [pullrequest_user.login]
-            pr_attributes["pr"] = [str(pullrequest.get_number())]
-
-            if not self.is_whitelisted(pullrequest_user, filters["default"]):
-                # Allow filter PR inclusion using include filter
+            if self.is_whitelisted(pullrequest_user, filters["default"]):
+                return None
+
+            # Allow filter PR inclusion using include filter
+            attributes = [get_local_attributes]
+            if filters["include"]["label"]:
+                attributes.append(get_label_attributes)
+            for get_attributes in attributes:
                 include, reason = self.run_filter(
-                    filters["include"], pr_attributes, action="Include")
-                if not include:
-                    excluded_pulls[pullrequest] = "user: %s" \
-                        % pullrequest_user.login
-                    continue
+                    filters["include"], get_attributes(pullrequest),
+                    action="Include")
+                if include:
+                    return None
+            return "user: %s" % pullrequest_user.login
+
+        def exclude_comment(pullrequest):
+            is_whitelisted_comment = lambda x: self.is_whitelisted(
+                x.user, filters["default"])
+            if pullrequest.parse('exclude', whitelist=is_whitelisted_comment):
+                return 'exclude comment'
+
+        def check_status(pullrequest):
+            # If no status on the base repo, fallback on the head repo
+            state = self.status_resolver.resolve(pullrequest) or ""
+
+            exclude_1 = (filters["status"] == "success-only") and \
+                (state != "success")
+            exclude_2 = (filters["status"] == "no-error") and \
+                (state in ["error", "failure"])
+            if exclude_1 or exclude_2:
+                return "status: %s" % state
+
+        # Labels are local if they have been indexed
+        label_cost = self.label_index is None and 1 or 0
+
+        pipeline = []
+        if filters["exclude"]["user"] or filters["exclude"]["pr"]:
+            pipeline.append((0, exclude_local))
+        if filters["default"] in ["org", "mine"]:
+            pipeline.append((1, check_whitelist))
+        else:
+            pipeline.append((label_cost, check_whitelist))
+        if filters["exclude"]["label"]:
+            pipeline.append((label_cost, exclude_label))
+        pipeline.append((2, exclude_comment))
 
-            # Exclude PRs specified by filters
-            exclude, reason = self.run_filter(
-                filters["exclude"], pr_attributes, action="Exclude")
-            if exclude:
-                excluded_pulls[pullrequest] = reason
-                continue
+        # Filter PRs by status if the status filter is on
+        if "status" in filters and filters["status"] != "none":
+            pipeline.append((STATUS_COST, check_status))
 
-            # Filter PRs by status if the status filter is on
-            if "status" in filters and filters["status"] != "none":
-                status = pullrequest.get_last_status("base")
-                if status is None:
-                    # If no status on the base repo, fallback on the head repo
-                    status = pullrequest.get_last_status("head")
+        pipeline.sort(key=lambda x: x[0])
+        return pipeline
 
-                if status is None:
-                    state = ""
-                else:
-                    state = status.state
-
-                exclude_1 = (filters["status"] == "success-only") and \
-                    (state != "success")
-                exclude_2 = (filters["status"] == "no-error") and \
-                    (state in ["error", "failure"])
-                if exclude_1 or exclude_2:
-                    excluded_pulls[pullrequest] = "status: %s" % state
-                    continue
+    def get_exclusion_reason(self, pullrequest, pipeline):
+        """
+        Run the stages of a filter pipeline on a Pull Request and return
+        the reason of the first stage excluding it or None.
+        """
+        for cost, stage in pipeline:
+            reason = stage(pullrequest)
+            if reason is not None:
+                return reason
+        return None
+
+    def find_candidates(self, filters, jobs=1):
+        """
+        Find candidate Pull Requests for merging.
+
+        Pull Requests are evaluated by a pool of up to jobs threads.
+        """
+        self.dbg("## PRs found:")
+        msg = ""
+
+        # Fail fast if default is none and no include filter is specified
+        no_include = all(v is None for v in filters["include"].values())
+        if filters["default"] == 'none' and no_include:
+            return msg
 
-            self.dbg(pullrequest)
-            self.candidate_pulls.append(pullrequest)
+        # Loop over pull requests opened aGainst base
+        pulls = self.get_pulls_by_base(filters["base"])
+
+        # Index labels in bulk rather than fetching the issue of each PR
+        if len(pulls) > 1 and \
+                (filters["include"]["label"] or filters["exclude"]["label"]):
+            self.build_label_index()
+
+        comment_index = self.get_comment_index()
+        pullrequests = [PullRequest(pull, label_index=self.label_index,
+                                    comment_index=comment_index)
+                        for pull in pulls]
+        pullrequests.sort(lambda a, b: cmp(a.get_number(), b.get_number()))
+        pipeline = self.get_filter_pipeline(filters)
+
+        # Run the cheap stages first so that the commit statuses of the
+        # remaining Pull Requests can be resolved in a single batch
+        stages = [x for x in pipeline if x[0] < STATUS_COST]
+        reasons = parallel_map(
+            lambda x: self.get_exclusion_reason(x, stages),
+            pullrequests, jobs)
+        stages = [x for x in pipeline if x[0] >= STATUS_COST]
+        if stages:
+            indices = [i for i, reason in enumerate(reasons)
+                       if reason is None]
+            remaining = [pullrequests[i] for i in indices]
+            self.status_resolver.prefetch(remaining, jobs)
+            remaining_reasons = parallel_map(
+                lambda x: self.get_exclusion_reason(x, stages),
+                remaining, jobs)
+            for i, reason in zip(indices, remaining_reasons):
+                reasons[i] = reason
+
+        excluded_pulls = []
+        for pullrequest, reason in zip(pullrequests, reasons):
+            if reason is None:
+                self.dbg(pullrequest)
+                self.candidate_pulls.append(pullrequest)
+            else:
+                excluded_pulls.append((pullrequest, reason))
 
         if excluded_pulls:
             msg += "Excluded PRs:\n"
-            for pull in excluded_pulls.keys():
-                msg += str(pull) + " (%s)" % excluded_pulls[pull] + "\n"
+            for pull, reason in excluded_pulls:
+                msg += str(pull) + " (%s)" % reason + "\n"
 
         self.candidate_pulls.sort(lambda a, b:
                                   cmp(a.get_number(), b.get_number()))
         return msg
 
 
+class CatFile(object):
+    """
+    Long-running git cat-file co-process of a repository.
+
+    Object names are written to the standard input of the process and the
+    answers read from its standard output, sparing a fork and exec of git
+    for each query. In --batch-check mode, each answer is the line
+    "<sha1> <type> <size>" or "<name> missing". In --batch mode, the line
+    is followed by the content of the object.
+    """
+
+    def __init__(self, path, mode="--batch-check"):
+        self.log = logging.getLogger("scc.git")
+        self.dbg = self.log.debug
+        self.path = path
+        self.mode = mode
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.dbg("Starting 'git cat-file %s' in %s", self.mode, self.path)
+        devnull = open(os.devnull, "w")
+        try:
+            self.process = subprocess.Popen(
+                ["git", "cat-file", self.mode], cwd=self.path,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=devnull)
+        finally:
+            devnull.close()
+
+    def stop(self):
+        """Terminate the co-process if it is running"""
+        with self.lock:
+            if self.process is None:
+                return
+            self.dbg("Stopping 'git cat-file %s' in %s", self.mode, self.path)
+            try:
+                self.process.stdin.close()
+                self.process.wait()
+            except (IOError, OSError):
+                pass
+            self.process = None
+
+    def read(self, name):
+        """Write name to the co-process and read the answer"""
+        self.process.stdin.write(name + "\n")
+        self.process.stdin.flush()
+        line = self.process.stdout.readline()
+        if not line:
+            raise IOError("git cat-file %s exited" % self.mode)
+        parts = line.split()
+        if len(parts) != 3:
+            return None
+        sha1, type, size = parts
+        content = None
+        if self.mode == "--batch":
+            content = self.process.stdout.read(int(size))
+            self.process.stdout.read(1)
+        return sha1, type, content
+
+    def query(self, name):
+        """
+        Return the (sha1, type, content) tuple of the object name or None
+        if the object does not exist. The content is None in
+        --batch-check mode.
+        """
+        if "\n" in name:
+            return None
+        with self.lock:
+            for attempt in range(2):
+                if self.process is None:
+                    self.start()
+                try:
+                    return self.read(name)
+                except (IOError, OSError):
+                    # Restart the co-process once if it died
+                    self.process = None
+                    if attempt:
+                        raise
+
+
 class GitRepository(object):
 
+    MAX_CACHED_MERGES = 50
+
     def __init__(self, gh, path, remote="origin"):
         """
         Register the git repository path, return the current status and
@@ -755,9 +1371,13 @@ class GitRepository(object):
         self.infoWrap = LoggerWrapper(self.log, logging.INFO)
 
         self.gh = gh
-        self.cd(path)
-        root_path, e = self.communicate("git", "rev-parse", "--show-toplevel")
+        root_path, e = self.communicate("git", "rev-parse", "--show-toplevel",
+                                        cwd=path)
         self.path = os.path.abspath(root_path.strip())
+        self.batch_check = CatFile(self.path, "--batch-check")
+        self.batch = CatFile(self.path, "--batch")
+        self.refs_lock = threading.RLock()
+        self.invalidate_refs()
 
         self.get_status()
 
@@ -768,26 +1388,33 @@ class GitRepository(object):
         if gh:
             self.origin = gh.gh_repo(repo_name, user_name)
 
-    def register_submodules(self):
+    def register_submodules(self, jobs=1):
+        """
+        Recursively register the submodules of the repository. Submodule
+        repositories are created by a pool of up to jobs threads and kept
+        in the order of the submodule paths.
+        """
         if len(self.submodules) == 0:
-            for directory in self.get_submodule_paths():
-                try:
-                    submodule_repo = self.gh.git_repo(directory)
-                    self.submodules.append(submodule_repo)
-                    submodule_repo.register_submodules()
-                finally:
-                    self.cd(self.path)
-
-    def cd(self, directory):
-        if not os.path.abspath(os.getcwd()) == os.path.abspath(directory):
-            self.dbg("cd %s", directory)
-            os.chdir(directory)
-
-    def communicate(self, *command):
+            def register(directory):
+                submodule_repo = self.gh.git_repo(
+                    os.path.join(self.path, directory))
+                submodule_repo.register_submodules(jobs=jobs)
+                return submodule_repo
+
+            self.submodules = parallel_map(
+                register, self.get_submodule_paths(), jobs)
+
+    def communicate(self, *command, **kwargs):
+        """
+        Run a command in the repository, or in the cwd keyword argument if
+        set, and return its stdout and stderr.
+        """
+        cwd = kwargs.get("cwd", getattr(self, "path", None))
         self.dbg("Calling '%s' for stdout/err" % " ".join(command))
         p = subprocess.Popen(command,
                              stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
+                             stderr=subprocess.PIPE,
+                             cwd=cwd)
         o, e = p.communicate()
         if p.returncode:
             msg = """Failed to run '%s'
@@ -817,9 +1444,14 @@ class GitRepository(object):
         return self.wrap_call(self.debugWrap, *command, **kwargs)
 
     def wrap_call(self, logWrap, *command, **kwargs):
+        """
+        Run a command in the repository. Unless specified, the command is
+        run from the repository path with its output logged by logWrap.
+        """
         for x in ("stdout", "stderr"):
             if x not in kwargs:
                 kwargs[x] = logWrap
+        kwargs.setdefault("cwd", self.path)
 
         try:
             no_wait = kwargs.pop("no_wait")
@@ -828,23 +1460,27 @@ class GitRepository(object):
 
         self.dbg("Calling '%s'" % " ".join(command))
         p = subprocess.Popen(command, **kwargs)
-        if not no_wait:
-            rc = p.wait()
-            if rc:
-                raise Exception("rc=%s" % rc)
+        try:
+            if not no_wait:
+                rc = p.wait()
+                if rc:
+                    raise Exception("rc=%s" % rc)
+        finally:
+            if not is_read_only(command):
+                self.invalidate_refs()
         return p
 
     def write_directories(self):
         """Write directories in candidate PRs comments to a txt file"""
 
-        self.cd(self.path)
         directories_log = None
 
         for pr in self.origin.candidate_pulls:
             directories = pr.parse_comments("test")
             if directories:
                 if directories_log is None:
-                    directories_log = open('directories.txt', 'w')
+                    directories_log = open(
+                        os.path.join(self.path, 'directories.txt'), 'w')
                 for directory in directories:
                     directories_log.write(directory)
                     directories_log.write("\n")
@@ -856,24 +1492,76 @@ class GitRepository(object):
     # General git commands
     #
 
+    def invalidate_refs(self):
+        """Discard the snapshot of the references and remotes"""
+        with self.refs_lock:
+            self.refs = None
+            self.head = None
+            self.remotes = None
+
+    def load_refs(self):
+        """
+        Load the references of the repository and the current branch with
+        a single git for-each-ref call unless they are already loaded.
+        """
+        with self.refs_lock:
+            if self.refs is not None:
+                return
+            self.dbg("Loading references")
+            o, e = self.communicate(
+                "git", "for-each-ref",
+                "--format=%(HEAD) %(objectname) %(refname)")
+            refs = {}
+            head = None
+            for line in o.splitlines():
+                current, sha1, ref = line[0], line[2:42], line[43:]
+                refs[ref] = sha1
+                if current == "*":
+                    head = ref
+            self.refs = refs
+            self.head = head
+
+    def get_refs(self):
+        """Return a dictionary of the references and their sha1s"""
+        with self.refs_lock:
+            self.load_refs()
+            return self.refs
+
     def get_current_head(self):
         """Return the symbolic name for the current branch"""
-        self.cd(self.path)
         self.dbg("Get current head")
-        o, e = self.communicate("git", "symbolic-ref", "HEAD")
-        o = o.strip()
+        with self.refs_lock:
+            self.load_refs()
+            head = self.head
+        if head is None:
+            raise Exception("HEAD of %s is not a branch" % self.path)
         refsheads = "refs/heads/"
-        if o.startswith(refsheads):
-            o = o[len(refsheads):]
-        return o
+        if head.startswith(refsheads):
+            head = head[len(refsheads):]
+        return head
+
+    def get_object_info(self, name):
+        """Return the (sha1, type) pair of an object or None if missing"""
+        info = self.batch_check.query(name)
+        if info is None:
+            return None
+        return info[:2]
+
+    def read_object(self, name):
+        """Return the (type, content) pair of an object or None if missing"""
+        info = self.batch.query(name)
+        if info is None:
+            return None
+        return info[1:]
 
     def get_sha1(self, branch):
         """Return the sha1 for the specified branch"""
 
-        self.cd(self.path)
-        self.dbg("Get sha1 of %s")
-        o, e = self.communicate("git", "rev-parse", branch)
-        return o.strip()
+        self.dbg("Get sha1 of %s", branch)
+        info = self.get_object_info(branch)
+        if info is None:
+            raise Exception("Failed to resolve %s" % branch)
+        return info[0]
 
     def get_current_sha1(self):
         """Return the sha1 for the current commit"""
@@ -882,7 +1570,6 @@ class GitRepository(object):
 
     def get_status(self):
         """Return the status of the git repository including its submodules"""
-        self.cd(self.path)
         self.dbg("Check current status")
         self.call("git", "log", "--oneline", "-n", "1", "HEAD")
         self.call("git", "submodule", "status")
@@ -892,18 +1579,15 @@ class GitRepository(object):
         Add a file to the repository. The path should
         be relative to the top of the repository.
         """
-        self.cd(self.path)
         self.dbg("Adding %s...", file)
         self.call("git", "add", file)
 
     def commit(self, msg):
-        self.cd(self.path)
         self.dbg("Committing %s...", msg)
         self.call("git", "commit", "-m", msg)
 
     def tag(self, tag, message=None, force=False):
         """Tag the HEAD of the git repository"""
-        self.cd(self.path)
         if message is None:
             message = "Tag with version %s" % tag
 
@@ -920,17 +1604,14 @@ class GitRepository(object):
             self.call("git", "tag", tag, "-m", message)
 
     def new_branch(self, name, head="HEAD"):
-        self.cd(self.path)
         self.dbg("New branch %s from %s...", name, head)
         self.call("git", "checkout", "-b", name, head)
 
     def checkout_branch(self, name):
-        self.cd(self.path)
         self.dbg("Checkout branch %s...", name)
         self.call("git", "checkout", name)
 
     def add_remote(self, name, url=None):
-        self.cd(self.path)
         if url is None:
             repo_name = self.origin.repo.name
             url = "git@github.com:%s/%s.git" % (name, repo_name)
@@ -938,12 +1619,31 @@ class GitRepository(object):
         self.call("git", "remote", "add", name, url)
 
     def fetch(self, remote="origin"):
-        self.cd(self.path)
         self.dbg("Fetching remote %s...", remote)
         self.call("git", "fetch", remote)
 
+    def fetch_pull_heads(self, pulls):
+        """
+        Fetch the heads of the pull requests from the refs/pull namespace
+        of the remote in a single fetch and return the pull requests whose
+        head commit is still missing locally.
+        """
+        missing = [x for x in pulls if not self.has_local_object(x.get_sha())]
+        if not missing:
+            return []
+        refspecs = ["refs/pull/%s/head" % x.get_number() for x in missing]
+        self.dbg("Fetching %s pull request heads from %s...",
+                 len(refspecs), self.remote)
+        try:
+            self.call("git", "fetch", self.remote, *refspecs)
+        except Exception:
+            self.dbg("Failed to fetch pull request heads from %s",
+                     self.remote, exc_info=1)
+            return missing
+        return [x for x in missing
+                if not self.has_local_object(x.get_sha())]
+
     def push_branch(self, name, remote="origin", force=False):
-        self.cd(self.path)
         self.dbg("Pushing branch %s to %s..." % (name, remote))
         if force:
             self.call("git", "push", "-f", remote, name)
@@ -951,19 +1651,16 @@ class GitRepository(object):
             self.call("git", "push", remote, name)
 
     def delete_local_branch(self, name, force=False):
-        self.cd(self.path)
         self.dbg("Deleting branch %s locally..." % name)
         d_switch = force and "-D" or "-d"
         self.call("git", "branch", d_switch, name)
 
     def delete_branch(self, name, remote="origin"):
-        self.cd(self.path)
         self.dbg("Deleting branch %s from %s..." % (name, remote))
         self.call("git", "push", remote, ":%s" % name)
 
     def reset(self):
         """Reset the git repository to its HEAD"""
-        self.cd(self.path)
         self.dbg("Resetting...")
         self.call("git", "reset", "--hard", "HEAD")
         self.call("git", "submodule", "update", "--recursive")
@@ -974,38 +1671,232 @@ class GitRepository(object):
         p = subprocess.Popen(
             ["git", "log", "--oneline", "--first-parent",
              "HEAD..%s/%s" % (remote, base)],
-            stdout=subprocess.PIPE).communicate()[0].rstrip("/n")
+            stdout=subprocess.PIPE,
+            cwd=self.path).communicate()[0].rstrip("/n")
         merge_log = p.rstrip("/n")
 
         p = subprocess.Popen(
             ["git", "merge", "--ff-only", "%s/%s" % (remote, base)],
-            stdout=subprocess.PIPE).communicate()[0].rstrip("/n")
+            stdout=subprocess.PIPE,
+            cwd=self.path).communicate()[0].rstrip("/n")
+        self.invalidate_refs()
         msg = p.rstrip("/n").split("\n")[0] + "\n"
         self.dbg(msg)
         return msg, merge_log
 
+    def merge_tree(self, base, commit):
+        """
+        Merge a commit into base in memory and return the resulting tree
+        and whether the merge is clean. Neither the worktree nor the index
+        are modified.
+        """
+        p = self.call_no_wait("git", "merge-tree", "--write-tree",
+                              "--no-messages", "--name-only", base, commit,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        o, e = p.communicate()
+        # Errors may also exit with 1 but do not output a tree
+        if p.returncode not in (0, 1) or not o.strip():
+            raise Exception("Failed to merge %s into %s: %s"
+                            % (commit, base, e))
+        return o.split("\n", 1)[0], p.returncode == 0
+
+    def get_merge_message(self, commit_id, pullrequest):
+        return "%s: PR %s (%s)" % (commit_id, pullrequest.get_number(),
+                                   pullrequest.get_title())
+
+    def create_merge_commits(self, pulls, head="HEAD", commit_id=None):
+        """
+        Merge the pull requests in memory one after the other on top of
+        head, skipping the conflicting ones as merge does. If commit_id is
+        set, the merge commits are given the messages used by merge.
+
+        Return the last merge commit and the lists of clean and conflicting
+        pull requests or None if in-memory merges are not supported by the
+        installed git.
+        """
+        clean = []
+        conflicting = []
+        try:
+            head = self.get_sha1(head)
+            for pullrequest in pulls:
+                sha = pullrequest.get_sha()
+                tree, is_clean = self.merge_tree(head, sha)
+                if not is_clean:
+                    conflicting.append(pullrequest)
+                    continue
+                if commit_id is None:
+                    message = "Dry merge of %s" % sha
+                else:
+                    message = self.get_merge_message(commit_id, pullrequest)
+                head, e = self.communicate(
+                    "git", "commit-tree", tree, "-p", head, "-p", sha,
+                    "-m", message)
+                head = head.strip()
+                clean.append(pullrequest)
+        except Exception:
+            self.dbg("Cannot merge pull requests in memory", exc_info=1)
+            return None
+        return head, clean, conflicting
+
+    def plan_merge(self, pulls, head="HEAD"):
+        """
+        Classify the pull requests as clean or conflicting by merging
+        them in memory one after the other on top of head, as merge does.
+
+        Return the lists of clean and conflicting pull requests or None if
+        in-memory merges are not supported by the installed git.
+        """
+        result = self.create_merge_commits(pulls, head=head)
+        if result is None:
+            return None
+        return result[1:]
+
+    def conflicts_info(self, base):
+        """List the candidate Pull Requests expected to conflict"""
+
+        pulls = self.origin.candidate_pulls
+        if not pulls:
+            return ""
+        missing = self.fetch_pull_heads(pulls)
+        pulls = [x for x in pulls if x not in missing]
+        plan = self.plan_merge(pulls, head="%s/%s" % (self.remote, base))
+        if plan is None:
+            return "Conflicts could not be checked\n"
+        msg = ""
+        if plan[1]:
+            msg += "Expected conflicting PRs:\n"
+            for pullrequest in plan[1]:
+                msg += str(pullrequest) + "\n"
+        if missing:
+            msg += "Unchecked PRs:\n"
+            for pullrequest in missing:
+                msg += str(pullrequest) + "\n"
+        return msg
+
+    def conflict_matrix(self, base, jobs=1):
+        """
+        Return a report of the pairwise mergeability of the candidate Pull
+        Requests on top of the base branch of the remote.
+
+        Pairs are merged in memory by a pool of up to jobs processes and
+        their results cached by (base, first, second) SHA1s so that only
+        the pairs involving new commits are merged again. Pairs including a
+        PR which conflicts with the base on its own are reported as unknown.
+        """
+        pulls = self.origin.candidate_pulls
+        self.fetch_pull_heads(pulls)
+        base_sha = self.get_sha1("%s/%s" % (self.remote, base))
+        shas = [x.get_sha() for x in pulls]
+
+        # Pairs are only meaningful if both PRs merge on their own
+        results = {}
+        self.merge_pairs(base_sha, shas, [(i, i) for i in range(len(shas))],
+                         results, jobs=jobs)
+        pairs = []
+        for i in range(len(shas)):
+            for j in range(i + 1, len(shas)):
+                if results[(i, i)] and results[(j, j)]:
+                    pairs.append((i, j))
+                else:
+                    results[(i, j)] = None
+        self.merge_pairs(base_sha, shas, pairs, results, jobs=jobs)
+
+        matrix = [[results[tuple(sorted((i, j)))] for j in range(len(pulls))]
+                  for i in range(len(pulls))]
+        return {
+            "repository": "%s/%s" % (self.origin.user_name,
+                                     self.origin.repo_name),
+            "base": base,
+            "base_sha": base_sha,
+            "pulls": [{"number": x.get_number(), "sha": x.get_sha(),
+                       "title": x.get_title()} for x in pulls],
+            "matrix": matrix,
+            "conflicts": [
+                [pulls[i].get_number(), pulls[j].get_number()]
+                for i, j in sorted(results)
+                if i != j and results[(i, j)] is False]}
+
+    def merge_pairs(self, base_sha, shas, pairs, results, jobs=1):
+        """
+        Store in results whether each (i, j) pair of commits merges on top
+        of base_sha, merging the pairs which are not cached in a pool of up
+        to jobs processes. A (i, i) pair is the merge of a single commit.
+        """
+        cache = self.gh and self.gh.cache
+        todo = []
+        for i, j in pairs:
+            key = "conflicts:%s:%s:%s" % (base_sha, shas[i], shas[j])
+            value = cache and cache.get(key)
+            if value is None:
+                todo.append((i, j))
+            else:
+                results[(i, j)] = value["clean"]
+
+        tasks = [(self.path, base_sha,
+                  i == j and [shas[i]] or [shas[i], shas[j]])
+                 for i, j in todo]
+        self.dbg("Merging %s pairs of PRs (%s cached)",
+                 len(tasks), len(pairs) - len(tasks))
+        if jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(tasks)))
+            try:
+                values = pool.map(merge_commits, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            values = [merge_commits(x) for x in tasks]
+
+        for (i, j), value in zip(todo, values):
+            results[(i, j)] = value
+            if cache and value is not None:
+                cache.set("conflicts:%s:%s:%s" % (
+                    base_sha, shas[i], shas[j]), {"clean": value})
+
+    def rconflict_matrix(self, base, jobs=1):
+        """Return the conflict matrix reports of all submodules."""
+
+        reports = [self.conflict_matrix(base, jobs=jobs)]
+        for submodule_repo in self.submodules:
+            reports.extend(submodule_repo.rconflict_matrix(base, jobs=jobs))
+        return reports
+
     def rebase(self, newbase, upstream, sha1):
         self.call_info("git", "rebase", "--onto",
                        "%s" % newbase, "%s" % upstream, "%s" % sha1)
 
-    def get_rev_list(self, commit):
+    def iter_rev_list(self, commit):
+        """
+        Yield the SHA1s of the first-parent history of commit as git
+        produces them. The git process is terminated if the iteration is
+        stopped before the end of the history.
+        """
         revlist_cmd = lambda x: ["git", "rev-list", "--first-parent", "%s" % x]
         p = subprocess.Popen(revlist_cmd(commit),
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=self.path)
         self.dbg("Calling '%s'" % " ".join(revlist_cmd(commit)))
-        (revlist, stderr) = p.communicate('')
+        complete = False
+        try:
+            for line in iter(p.stdout.readline, ""):
+                yield line.strip()
+            complete = True
+        finally:
+            p.stdout.close()
+            if not complete and p.poll() is None:
+                p.terminate()
+            stderr = p.stderr.read()
+            p.stderr.close()
+            p.wait()
 
         if stderr or p.returncode:
-            msg = "Error output was:\n%s" % stderr
-            if revlist.strip():
-                msg += "Output was:\n%s" % revlist
-            raise Exception(msg)
+            raise Exception("Error output was:\n%s" % stderr)
 
-        return revlist.splitlines()
+    def get_rev_list(self, commit):
+        return list(self.iter_rev_list(commit))
 
     def has_local_changes(self):
         """Check for local changes in the Git repository"""
-        self.cd(self.path)
         try:
             self.call("git", "diff-index", "--quiet", "HEAD")
             self.dbg("%s has no local changes", self)
@@ -1017,12 +1908,9 @@ class GitRepository(object):
     def has_ref(self, ref):
         """Check for reference existence in the local Git repository"""
 
-        self.cd(self.path)
-        try:
-            self.call("git", "show-ref", "--verify", "--quiet", ref)
-            return True
-        except Exception:
-            return False
+        if ref.startswith("refs/"):
+            return ref in self.get_refs()
+        return self.get_object_info(ref) is not None
 
     def has_local_tag(self, tag):
         """Check for tag existence in the local Git repository"""
@@ -1042,17 +1930,11 @@ class GitRepository(object):
     def has_local_object(self, commit):
         """Check for object existence in the local Git repository"""
 
-        self.cd(self.path)
-        try:
-            self.call("git", "cat-file", "-e", commit)
-            return True
-        except Exception:
-            return False
+        return self.get_object_info(commit) is not None
 
     def is_valid_tag(self, tag):
         """Check the validity of a reference name for a tag"""
 
-        self.cd(self.path)
         try:
             self.call("git", "check-ref-format", "refs/tags/%s" % tag)
             return True
@@ -1072,7 +1954,6 @@ class GitRepository(object):
     def merge_base(self, a, b):
         """Return the first ancestor between two branches"""
 
-        self.cd(self.path)
         mrg, err = self.call("git", "merge-base", a, b,
                              stdout=subprocess.PIPE).communicate()
         return mrg.strip()
@@ -1080,18 +1961,39 @@ class GitRepository(object):
     def list_remotes(self):
         """Return a list of existing remotes"""
 
-        self.cd(self.path)
-        remotes = self.call("git", "remote",
-                            stdout=subprocess.PIPE).communicate()[0]
-        remotes = remotes.split("\n")[:-1]
+        with self.refs_lock:
+            if self.remotes is None:
+                remotes = self.call("git", "remote",
+                                    stdout=subprocess.PIPE).communicate()[0]
+                self.remotes = remotes.split("\n")[:-1]
+            return list(self.remotes)
 
-        return remotes
+    def list_merged(self, target, refs):
+        """
+        Return the description lines of the refs whose tip is an ancestor
+        of target, sorted by committer date, using a single git call.
+        Refs pointing to annotated tags are excluded since their tip is
+        not a commit.
+        """
+        fmt = "%(committerdate:iso8601) %(refname:short)   --- %(subject)"
+        cmd = ["git", "for-each-ref", "--sort=committerdate"]
+        cmd.append("--merged=%s" % target)
+        cmd.append("--format=%%(objecttype) %s" % fmt)
+        cmd += refs
+        proc = self.call_no_wait(*cmd, stdout=subprocess.PIPE)
+        out, err = proc.communicate()
+        if proc.returncode:
+            raise Exception("rc=%s" % proc.returncode)
+        lines = []
+        for line in out.split("\n"):
+            if line.startswith("commit "):
+                lines.append(line[len("commit "):].rstrip())
+        return lines
 
     def get_remote_url(self, remote_name="origin"):
         """Return the URL of the remote"""
 
-        self.cd(self.path)
-        return git_config("remote.%s.url" % remote_name)
+        return git_config("remote.%s.url" % remote_name, cwd=self.path)
 
     #
     # Higher level git commands
@@ -1128,44 +2030,143 @@ class GitRepository(object):
             repo = basename.rsplit()[0]
         return [user, repo]
 
-    def merge(self, comment=False, commit_id="merge",
-              set_commit_status=False):
-        """Merge candidate pull requests."""
-        self.dbg("## Unique users: %s", self.unique_logins())
-        for key, url in self.get_merge_remotes().items():
-            self.call("git", "remote", "add", key, url)
-            self.fetch(key)
-
-        conflicting_pulls = []
-        merged_pulls = []
+    def get_merge_fingerprint(self, filters, commit_id):
+        """
+        Return a fingerprint of the merge of the candidate pull requests
+        on top of the current HEAD with the given filters.
+        """
+        try:
+            from hashlib import sha1 as sha_new
+        except ImportError:
+            from sha import new as sha_new
+        data = json.dumps([
+            "%s/%s" % (self.origin.user_name, self.origin.repo_name),
+            self.get_current_sha1(),
+            [x.get_sha() for x in self.origin.candidate_pulls],
+            filters, commit_id], sort_keys=True)
+        return sha_new(data).hexdigest()
+
+    def get_cached_merge(self, fingerprint):
+        """
+        Return the merge commit and the lists of merged and conflicting
+        pull requests of a previous merge with the same fingerprint or None
+        """
+        ref = "refs/scc/merges/%s" % fingerprint
+        value = self.gh.cache.get("merge:%s" % fingerprint)
+        if value is None or not self.has_ref(ref):
+            return None
+        pulls = dict((x.get_number(), x) for x in self.origin.candidate_pulls)
+        try:
+            return (self.get_sha1(ref),
+                    [pulls[x] for x in value["merged"]],
+                    [pulls[x] for x in value["conflicting"]])
+        except KeyError:
+            return None
 
-        for pullrequest in self.origin.candidate_pulls:
-            premerge_sha, e = self.call(
-                "git", "rev-parse", "HEAD",
-                stdout=subprocess.PIPE).communicate()
-            premerge_sha = premerge_sha.rstrip("\n")
+    def set_cached_merge(self, fingerprint, head, merged, conflicting):
+        """
+        Store the result of a merge, keeping its merge commit alive with a
+        local reference, and prune the references of older merges. Failing
+        to store the result does not fail the merge.
+        """
+        try:
+            self.call("git", "update-ref",
+                      "refs/scc/merges/%s" % fingerprint, head)
+            self.gh.cache.set("merge:%s" % fingerprint, {
+                "merged": [x.get_number() for x in merged],
+                "conflicting": [x.get_number() for x in conflicting]})
+        except Exception:
+            self.log.warn("Failed to cache merge %s", fingerprint, exc_info=1)
+        self.prune_cached_merges()
 
+    def prune_cached_merges(self):
+        """
+        Delete the references of the cached merges whose cache entry has
+        been evicted and of the least recently used merges beyond
+        MAX_CACHED_MERGES.
+        """
+        o, e = self.communicate("git", "for-each-ref",
+                                "--format=%(refname)", "refs/scc/merges")
+        stale = []
+        entries = []
+        for ref in o.split():
+            filename = self.gh.cache.get_filename(
+                "merge:%s" % ref.rsplit("/", 1)[-1])
             try:
-                self.call("git", "merge", "--no-ff", "-m", "%s: PR %s (%s)"
-                          % (commit_id, pullrequest.get_number(),
-                             pullrequest.get_title()), pullrequest.get_sha())
-                merged_pulls.append(pullrequest)
-            except:
-                self.call("git", "reset", "--hard", "%s" % premerge_sha)
-                conflicting_pulls.append(pullrequest)
+                entries.append((os.stat(filename).st_mtime, ref))
+            except OSError:
+                stale.append(ref)
+        entries.sort(reverse=True)
+        stale.extend(ref for mtime, ref in entries[self.MAX_CACHED_MERGES:])
+        if not stale:
+            return
 
-                msg = "Conflicting PR."
-                if IS_JENKINS_JOB:
-                    msg += "Removed from build [%s#%s](%s). See the " \
-                           "[console output](%s) for more details." \
-                           % (JOB_NAME, BUILD_NUMBER, BUILD_URL,
-                              BUILD_URL + "/consoleText")
-                self.dbg(msg)
+        self.dbg("Pruning %s cached merges", len(stale))
+        p = self.call_no_wait("git", "update-ref", "--stdin",
+                              stdin=subprocess.PIPE)
+        p.communicate("".join("delete %s\n" % x for x in stale))
+        self.invalidate_refs()
+        if p.returncode:
+            self.log.warn("Failed to prune cached merges")
 
-                if comment and get_token():
-                    self.dbg("Adding comment to issue #%g."
-                             % pullrequest.get_number())
-                    pullrequest.create_issue_comment(msg)
+    def merge(self, comment=False, commit_id="merge",
+              set_commit_status=False, strategy="sequential", filters=None):
+        """
+        Merge candidate pull requests.
+
+        With the sequential strategy, the pull requests are merged one by
+        one in the worktree, skipping those expected to conflict. With the
+        batch strategy, all merge commits are created in memory and the
+        worktree is only updated once.
+
+        If filters are passed and the cache is enabled, the result of a
+        previous merge of the same pull request heads with the same
+        filters on top of the same commit is reused.
+        """
+        fingerprint = None
+        result = None
+        if filters is not None and self.gh and self.gh.cache is not None:
+            fingerprint = self.get_merge_fingerprint(filters, commit_id)
+            result = self.get_cached_merge(fingerprint)
+            if result is not None:
+                self.dbg("Reusing cached merge %s", result[0])
+                self.call("git", "merge", "--ff-only", result[0])
+
+        if result is None:
+            missing = self.fetch_pull_heads(self.origin.candidate_pulls)
+            if missing:
+                # Fall back to fetching the remaining heads from the forks
+                self.dbg("## Unique users: %s", self.unique_logins(missing))
+                for key, url in self.get_merge_remotes(missing).items():
+                    self.call("git", "remote", "add", key, url)
+                    self.fetch(key)
+
+            if strategy == "batch":
+                result = self.create_merge_commits(
+                    self.origin.candidate_pulls, commit_id=commit_id)
+            if result is not None:
+                self.call("git", "merge", "--ff-only", result[0])
+            else:
+                result = (None,) + self.merge_sequentially(
+                    self.origin.candidate_pulls, commit_id)
+            if fingerprint is not None:
+                self.set_cached_merge(fingerprint, self.get_current_sha1(),
+                                      *result[1:])
+        head, merged_pulls, conflicting_pulls = result
+
+        for pullrequest in conflicting_pulls:
+            msg = "Conflicting PR."
+            if IS_JENKINS_JOB:
+                msg += "Removed from build [%s#%s](%s). See the " \
+                       "[console output](%s) for more details." \
+                       % (JOB_NAME, BUILD_NUMBER, BUILD_URL,
+                          BUILD_URL + "/consoleText")
+            self.dbg(msg)
+
+            if comment and get_token():
+                self.dbg("Adding comment to issue #%g."
+                         % pullrequest.get_number())
+                pullrequest.create_issue_comment(msg)
 
         merge_msg = ""
         if merged_pulls:
@@ -1191,6 +2192,42 @@ class GitRepository(object):
         self.call("git", "submodule", "update")
         return merge_msg
 
+    def merge_sequentially(self, pulls, commit_id):
+        """
+        Merge the pull requests one by one in the worktree and return the
+        lists of merged and conflicting pull requests.
+        """
+        conflicting_pulls = []
+        merged_pulls = []
+
+        # Only apply the pull requests known to merge cleanly
+        expected_conflicts = []
+        plan = self.plan_merge(pulls)
+        if plan is not None:
+            expected_conflicts = plan[1]
+
+        for pullrequest in pulls:
+            if pullrequest in expected_conflicts:
+                self.dbg("Skipping conflicting PR %s",
+                         pullrequest.get_number())
+                conflicting_pulls.append(pullrequest)
+                continue
+
+            premerge_sha, e = self.call(
+                "git", "rev-parse", "HEAD",
+                stdout=subprocess.PIPE).communicate()
+            premerge_sha = premerge_sha.rstrip("\n")
+
+            try:
+                self.call("git", "merge", "--no-ff", "-m",
+                          self.get_merge_message(commit_id, pullrequest),
+                          pullrequest.get_sha())
+                merged_pulls.append(pullrequest)
+            except:
+                self.call("git", "reset", "--hard", "%s" % premerge_sha)
+                conflicting_pulls.append(pullrequest)
+        return merged_pulls, conflicting_pulls
+
     def set_commit_status(self, status, message, url):
         msg = ""
         for pullrequest in self.origin.candidate_pulls:
@@ -1203,66 +2240,102 @@ class GitRepository(object):
         return msg
 
     def find_branching_point(self, topic_branch, main_branch):
-        topic_revlist = self.get_rev_list(topic_branch)
-        main_revlist = self.get_rev_list(main_branch)
+        """
+        Return the first commit of the first-parent history of the topic
+        branch which is also in the first-parent history of the main branch.
+
+        The first-parent histories of two branches are identical from their
+        first shared commit onwards. Both histories are therefore read in
+        lockstep and the first commit seen on both sides is returned,
+        without reading the histories beyond it.
+        """
+        revlists = [self.iter_rev_list(x) for x in (topic_branch, main_branch)]
+        seen = (set(), set())
+        sha1 = None
+        try:
+            while sha1 is None:
+                lines = [next(x, None) for x in revlists]
+                if lines == [None, None]:
+                    break
+                for i, line in enumerate(lines):
+                    if line is None:
+                        continue
+                    if line in seen[1 - i]:
+                        sha1 = line
+                        break
+                    seen[i].add(line)
+        finally:
+            for revlist in revlists:
+                revlist.close()
 
-        # Compare sequences
-        s = difflib.SequenceMatcher(None, topic_revlist, main_revlist)
-        matching_block = s.get_matching_blocks()
-        if matching_block[0].size == 0:
+        if sha1 is None:
             raise Exception("No matching block found")
 
-        sha1 = main_revlist[matching_block[0].b]
         self.info("Branching SHA1: %s" % sha1[0:6])
         return sha1
 
-    def rset_commit_status(self, filters, status, message, url, info=False):
+    def get_submodule_filters(self, filters, submodule_repo):
+        """Return a copy of the filters restricted to a submodule."""
+        submodule_name = "%s/%s" % (submodule_repo.origin.user_name,
+                                    submodule_repo.origin.repo_name)
+
+        # Create submodule filters
+        import copy
+        submodule_filters = copy.deepcopy(filters)
+
+        for ftype in ["include", "exclude"]:
+            if submodule_filters[ftype]["pr"]:
+                submodule_prs = [x.replace(submodule_name, '')
+                                 for x in submodule_filters[ftype]["pr"]
+                                 if x.startswith(submodule_name)]
+                if len(submodule_prs) > 0:
+                    submodule_filters[ftype]["pr"] = submodule_prs
+                else:
+                    submodule_filters[ftype]["pr"] = None
+        return submodule_filters
+
+    def rset_commit_status(self, filters, status, message, url, info=False,
+                           jobs=1):
         """Recursively set commit status for PRs for each submodule."""
 
         msg = ""
         msg += str(self.origin) + "\n"
-        msg += self.origin.find_candidates(filters)
+        msg += self.origin.find_candidates(filters, jobs=jobs)
         if info:
             msg += self.origin.merge_info()
         else:
             msg += self.set_commit_status(status, message, url)
 
         for submodule_repo in self.submodules:
-            submodule_name = "%s/%s" % (submodule_repo.origin.user_name,
-                                        submodule_repo.origin.repo_name)
-
-            # Create submodule filters
-            import copy
-            submodule_filters = copy.deepcopy(filters)
-
-            for ftype in ["include", "exclude"]:
-                if submodule_filters[ftype]["pr"]:
-                    submodule_prs = [x.replace(submodule_name, '')
-                                     for x in submodule_filters[ftype]["pr"]
-                                     if x.startswith(submodule_name)]
-                    if len(submodule_prs) > 0:
-                        submodule_filters[ftype]["pr"] = submodule_prs
-                    else:
-                        submodule_filters[ftype]["pr"] = None
-
+            submodule_filters = self.get_submodule_filters(
+                filters, submodule_repo)
             msg += submodule_repo.rset_commit_status(
-                submodule_filters, status, message, url, info)
+                submodule_filters, status, message, url, info, jobs=jobs)
 
         return msg
 
     def rmerge(self, filters, info=False, comment=False, commit_id="merge",
                top_message=None, update_gitmodules=False,
-               set_commit_status=False):
-        """Recursively merge PRs for each submodule."""
+               set_commit_status=False, jobs=1, check_conflicts=False,
+               strategy="sequential"):
+        """
+        Recursively merge PRs for each submodule.
+
+        Submodules are merged by a pool of up to jobs threads once the
+        repository itself has been merged. Their messages are appended in
+        the order of the submodules and the final commit of the repository
+        is only created after all submodules have been merged.
+        """
 
         updated = False
         merge_msg = ""
         merge_msg += str(self.origin) + "\n"
-        merge_msg += self.origin.find_candidates(filters)
+        merge_msg += self.origin.find_candidates(filters, jobs=jobs)
         if info:
             merge_msg += self.origin.merge_info()
+            if check_conflicts:
+                merge_msg += self.conflicts_info(filters["base"])
         else:
-            self.cd(self.path)
             self.write_directories()
             presha1 = self.get_current_sha1()
             ff_msg, ff_log = self.fast_forward(filters["base"],
@@ -1280,36 +2353,24 @@ class GitRepository(object):
             merge_msg += '\n'
 
             merge_msg += self.merge(comment, commit_id=commit_id,
-                                    set_commit_status=set_commit_status)
+                                    set_commit_status=set_commit_status,
+                                    strategy=strategy, filters=filters)
             postsha1 = self.get_current_sha1()
             updated = (presha1 != postsha1)
 
-        for submodule_repo in self.submodules:
-            submodule_name = "%s/%s" % (submodule_repo.origin.user_name,
-                                        submodule_repo.origin.repo_name)
-
-            # Create submodule filters
-            import copy
-            submodule_filters = copy.deepcopy(filters)
-
-            for ftype in ["include", "exclude"]:
-                if submodule_filters[ftype]["pr"]:
-                    submodule_prs = [x.replace(submodule_name, '')
-                                     for x in submodule_filters[ftype]["pr"]
-                                     if x.startswith(submodule_name)]
-                    if len(submodule_prs) > 0:
-                        submodule_filters[ftype]["pr"] = submodule_prs
-                    else:
-                        submodule_filters[ftype]["pr"] = None
+        def merge_submodule(submodule_repo):
+            submodule_filters = self.get_submodule_filters(
+                filters, submodule_repo)
+            submodule_updated, submodule_msg = submodule_repo.rmerge(
+                submodule_filters, info, comment, commit_id=commit_id,
+                update_gitmodules=update_gitmodules,
+                set_commit_status=set_commit_status, jobs=jobs,
+                check_conflicts=check_conflicts, strategy=strategy)
+            return submodule_msg
 
-            try:
-                submodule_updated, submodule_msg = submodule_repo.rmerge(
-                    submodule_filters, info, comment, commit_id=commit_id,
-                    update_gitmodules=update_gitmodules,
-                    set_commit_status=set_commit_status)
-                merge_msg += "\n" + submodule_msg
-            finally:
-                self.cd(self.path)
+        for submodule_msg in parallel_map(merge_submodule, self.submodules,
+                                          jobs):
+            merge_msg += "\n" + submodule_msg
 
         if IS_JENKINS_JOB:
             merge_msg_footer = "\nGenerated by %s#%s (%s)" \
@@ -1330,14 +2391,15 @@ class GitRepository(object):
                     # Read submodule URL registered in .gitmodules
                     config_name = "submodule.%s.url" % path
                     submodule_url = git_config(config_name,
-                                               config_file=".gitmodules")
+                                               config_file=".gitmodules",
+                                               cwd=self.path)
 
                     # Substitute submodule URL using connection login
                     user = self.gh.get_login()
                     pattern = '(.*github.com[:/]).*(/.*.git)'
                     new_url = re.sub(pattern, r'\1%s\2' % user, submodule_url)
                     git_config(config_name, config_file=".gitmodules",
-                               value=new_url)
+                               value=new_url, cwd=self.path)
 
             if self.has_local_changes():
                 self.call("git", "commit", "-a", "-n", "-m", commit_message)
@@ -1347,7 +2409,6 @@ class GitRepository(object):
     def get_tag_prefix(self):
         "Return the tag prefix for this repository using git describe"
 
-        self.cd(self.path)
         try:
             version, e = self.call("git", "describe",
                                    stdout=subprocess.PIPE).communicate()
@@ -1375,17 +2436,22 @@ class GitRepository(object):
 
         return msg
 
-    def unique_logins(self):
-        """Return a set of unique logins."""
+    def unique_logins(self, pulls=None):
+        """
+        Return a set of unique logins of the pull requests, by default the
+        candidate pull requests.
+        """
+        if pulls is None:
+            pulls = self.origin.candidate_pulls
         unique_logins = set()
-        for pull in self.origin.candidate_pulls:
+        for pull in pulls:
             unique_logins.add(pull.get_head_login())
         return unique_logins
 
-    def get_merge_remotes(self):
+    def get_merge_remotes(self, pulls=None):
         """Return remotes associated to unique login."""
         remotes = {}
-        for user in self.unique_logins():
+        for user in self.unique_logins(pulls):
             key = "merge_%s" % user
             if self.origin.private:
                 url = "git@github.com:%s/%s.git" % (user, self.origin.name)
@@ -1403,11 +2469,14 @@ class GitRepository(object):
                 submodule_repo.rcleanup()
             except:
                 self.dbg("Failed to clean repository %s" % self.path)
-            self.cd(self.path)
 
     def cleanup(self):
-        """Remove remote branches created for merging."""
-        self.cd(self.path)
+        """
+        Remove remote branches created for merging and stop the git
+        co-processes.
+        """
+        self.batch_check.stop()
+        self.batch.stop()
         if self.gh:  # no gh implies no connection
             remotes = self.list_remotes()
             merge_remotes = [x for x in self.get_merge_remotes().keys()
@@ -1426,10 +2495,7 @@ class GitRepository(object):
         self.dbg("Pushed %s to %s" % (branch_name, full_remote))
 
         for submodule_repo in self.submodules:
-            try:
-                submodule_repo.rpush(branch_name, remote, force=force)
-            finally:
-                self.cd(self.path)
+            submodule_repo.rpush(branch_name, remote, force=force)
 
 #
 # Exceptions
@@ -1453,6 +2519,7 @@ class GithubCommand(Command):
     """
 
     NAME = "abstract"
+    stats_registered = False
 
     def __init__(self, sub_parsers):
         super(GithubCommand, self).__init__(sub_parsers)
@@ -1462,6 +2529,7 @@ class GithubCommand(Command):
                                      "Merge\spull\srequest\s.(\d+)\s(.*)$")
         self.commit_pattern = re.compile(sha1_chars + "(.*)$")
         self.add_token_args()
+        self.add_cache_args()
 
     def configure_logging(self, args):
         super(GithubCommand, self).configure_logging(args)
@@ -1476,7 +2544,12 @@ class GithubCommand(Command):
             print "# github.token and github.user not found."
             print "# See `%s token` for simpifying use." % sys.argv[0]
             token = raw_input("Username or token: ").strip()
-        self.gh = get_github(token, dont_ask=args.no_ask)
+        GHManager.stats.command = self.NAME
+        self.gh = get_github(token, dont_ask=args.no_ask,
+                             cache=not args.no_cache)
+        if not self.stats_registered:
+            atexit.register(GHManager.stats.report)
+            GithubCommand.stats_registered = True
 
     def parse_pr(self, line):
         m = self.pr_pattern.match(line)
@@ -1508,6 +2581,11 @@ class GithubCommand(Command):
             "--no-ask", action='store_true',
             help="Do not ask for a password if token usage fails")
 
+    def add_cache_args(self):
+        self.parser.add_argument(
+            "--no-cache", action='store_true',
+            help="Do not use the on-disk cache of GitHub responses")
+
 
 class GitRepoCommand(GithubCommand):
     """
@@ -1526,10 +2604,17 @@ class GitRepoCommand(GithubCommand):
             help='Reset the current branch to its HEAD')
         self.add_remote_arg()
 
+    def add_jobs_arg(self):
+        self.parser.add_argument(
+            '--jobs', '-j', type=int, default=1,
+            help='Number of Pull Requests or submodules to process in '
+            'parallel. Default: 1')
+
     def init_main_repo(self, args):
         self.main_repo = self.gh.git_repo(self.cwd, remote=args.remote)
         if not args.shallow:
-            self.main_repo.register_submodules()
+            self.main_repo.register_submodules(
+                jobs=getattr(args, "jobs", 1))
         if args.reset:
             self.main_repo.reset()
             self.main_repo.get_status()
@@ -1564,8 +2649,9 @@ class GitRepoCommand(GithubCommand):
         user = self.gh.get_login()
         branch_name = args.push
 
-        for pull in self.main_repo.origin.get_pulls():
-            if pull.head.user.login == user and pull.head.ref == branch_name:
+        for pull in self.main_repo.origin.get_pulls_by_head(user,
+                                                            branch_name):
+            if pull.head.user.login == user:
                 self.log.info("PR %s already opened", pull.number)
                 return PullRequest(pull)
 
@@ -1609,6 +2695,7 @@ created by a public member of the organization. Default: org.""")
             choices=["none", "no-error", "success-only"], default="none",
             help='Check success/failure status on latest commits to include '
             ' PRs in the merge.')
+        self.add_jobs_arg()
 
     def _log_parse_filters(self, args, default_user):
         self.log.info("%s on PR based on %s opened by %s",
@@ -1828,27 +2915,8 @@ class AlreadyMerged(GithubCommand):
             main_repo.cleanup()
 
     def already_merged(self, args, main_repo):
-        fmt = "%(committerdate:iso8601) %(refname:short)   --- %(subject)"
-        cmd = ["git", "for-each-ref", "--sort=committerdate"]
-        cmd.append("--format=%s" % fmt)
-        cmd += args.ref
-        proc = main_repo.call(*cmd, stdout=subprocess.PIPE)
-        out, err = proc.communicate()
-        for line in out.split("\n"):
-            if line:
-                self.go(main_repo, line.rstrip(), args.target)
-
-    def go(self, main_repo, input, target):
-        parts = input.split(" ")
-        branch = parts[3]
-        tip, err = main_repo.call(
-            "git", "rev-parse", branch,
-            stdout=subprocess.PIPE).communicate()
-        mrg, err = main_repo.call(
-            "git", "merge-base", branch, target,
-            stdout=subprocess.PIPE).communicate()
-        if tip == mrg:
-            print input
+        for line in main_repo.list_merged(args.target, args.ref):
+            print line
 
 
 class CleanSandbox(GithubCommand):
@@ -1996,11 +3064,26 @@ class Merge(FilteredPullRequestsCommand):
             '--set-commit-status', action='store_true',
             help='Set success/failure status on latest commits in all PRs '
             'in the merge.')
+        self.parser.add_argument(
+            '--check-conflicts', action='store_true',
+            help='With --info, fetch the PR heads and report the PRs '
+            'expected to conflict')
+        self.parser.add_argument(
+            '--conflict-matrix', nargs='?', const="", metavar='REPORT',
+            help='Do not merge but compute the pairwise conflicts of the '
+            'PRs, optionally writing a JSON report to REPORT')
+        self.parser.add_argument(
+            '--strategy', choices=['sequential', 'batch'],
+            default='sequential',
+            help='Merge the PRs one by one in the working tree or create '
+            'all merge commits in memory first. Default: sequential')
         self.add_new_commit_args()
 
     def __call__(self, args):
         super(Merge, self).__call__(args)
         self.login(args)
+        if args.conflict_matrix is not None:
+            args.info = True
 
         self.init_main_repo(args)
 
@@ -2037,12 +3120,28 @@ class Merge(FilteredPullRequestsCommand):
             args.comment, commit_id=" ".join(commit_args),
             top_message=args.message,
             update_gitmodules=args.update_gitmodules,
-            set_commit_status=args.set_commit_status)
+            set_commit_status=args.set_commit_status, jobs=args.jobs,
+            check_conflicts=args.check_conflicts, strategy=args.strategy)
 
         for line in merge_msg.split("\n"):
             self.log.info(line)
+        if args.conflict_matrix is not None:
+            self.conflict_matrix(args, main_repo)
         return updated
 
+    def conflict_matrix(self, args, main_repo):
+        reports = main_repo.rconflict_matrix(self.filters["base"],
+                                             jobs=args.jobs)
+        for report in reports:
+            for line in format_conflict_matrix(report):
+                self.log.info(line)
+        if args.conflict_matrix:
+            f = open(args.conflict_matrix, "w")
+            try:
+                json.dump(reports, f, indent=2)
+            finally:
+                f.close()
+
     def _log_parse_filters(self, args, default_user):
         if args.info:
             action = "Finding"
@@ -2366,7 +3465,9 @@ class TravisMerge(GitRepoCommand):
         args.reset = False
         self.init_main_repo(args)
 
-        pr = PullRequest(self.main_repo.origin.get_pull(int(pr_number)))
+        origin = self.main_repo.origin
+        pr = PullRequest(origin.get_pull(int(pr_number)),
+                         comment_index=origin.get_comment_index())
 
         # Parse comments for companion PRs inclusion in the Travis build
         self._parse_dependencies(pr.get_base(),
@@ -2584,7 +3685,8 @@ command.
         unrebased_prs = []
         rebased_dict = dict.fromkeys(pr_list)
         for pr_number in pr_list:
-            pr = PullRequest(repo.origin.get_pull(pr_number))
+            pr = PullRequest(repo.origin.get_pull(pr_number),
+                             comment_index=repo.origin.get_comment_index())
 
             rebased_notes = pr.parse(['rebased', 'no-rebase'])
             if rebased_notes:
@@ -2620,7 +3722,8 @@ command.
         m2 = self.check_directed_links(d1, d2)
 
         def visit_pr(gh_repo, pr_number, branch):
-            pr = PullRequest(gh_repo.get_pull(pr_number))
+            pr = PullRequest(gh_repo.get_pull(pr_number),
+                             comment_index=gh_repo.get_comment_index())
             if (pr.pull.state == 'open' or pr.pull.is_merged()) and \
                     pr.get_base() == branch:
                 return pr.parse(['rebased', 'no-rebase'])
@@ -2697,6 +3800,7 @@ class UpdateSubmodules(GitRepoCommand):
             '--no-pr', action='store_false',
             dest='pr', default=True, help='Skip creating a PR.')
         self.add_new_commit_args()
+        self.add_jobs_arg()
 
     def __call__(self, args):
         super(UpdateSubmodules, self).__call__(args)
@@ -2737,11 +3841,9 @@ class UpdateSubmodules(GitRepoCommand):
             self.main_repo.rcleanup()
 
     def submodules(self, args, main_repo):
-        for submodule in main_repo.submodules:
-            submodule.cd(submodule.path)
-            if not args.no_fetch:
-                submodule.fetch(args.remote)
-            #submodule.checkout_branch("%s/%s" % (args.remote, args.base))
+        if not args.no_fetch:
+            parallel_map(lambda x: x.fetch(args.remote), main_repo.submodules,
+                         args.jobs)
 
         # Create commit message using command arguments
         self.filters = {}
@@ -2753,7 +3855,8 @@ class UpdateSubmodules(GitRepoCommand):
         updated, merge_msg = main_repo.rmerge(
             self.filters,
             top_message=args.message,
-            update_gitmodules=args.update_gitmodules)
+            update_gitmodules=args.update_gitmodules,
+            jobs=args.jobs)
         for line in merge_msg.split("\n"):
             self.log.info(line)
         return updated, merge_msg
@@ -2793,7 +3896,7 @@ class SetCommitStatus(FilteredPullRequestsCommand):
         self._parse_filters(args)
         msg = main_repo.rset_commit_status(
             self.filters, args.status, args.message,
-            args.url, info=args.info)
+            args.url, info=args.info, jobs=args.jobs)
         for line in msg.split("\n"):
             self.log.info(line)
 
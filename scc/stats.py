@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Statistics of the requests sent to the GitHub API.
+
+The summary of the requests of a run is logged at info level on exit and
+additionally written as JSON to the file named by the environment variable
+below if it is set.
+
+Environment variables:
+    SCC_STATS_FILE      default: None
+
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+
+
+SCC_STATS_FILE = os.environ.get("SCC_STATS_FILE")
+
+REPO_PATTERN = re.compile(r"^/repos/([^/]+/[^/]+)(/.*)?$")
+SHA_PATTERN = re.compile(r"/[0-9a-f]{40}(?=/|$)")
+NUMBER_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+
+def get_endpoint(verb, url):
+    """
+    Return the (repository, endpoint) pair of a request. Numbers and SHA1s
+    are replaced by placeholders so that requests to the same API endpoint
+    are grouped together.
+    """
+    path = url.split("?", 1)[0]
+    if "://" in path:
+        path = "/" + path.split("/", 3)[-1]
+    repo = None
+    match = REPO_PATTERN.match(path)
+    if match:
+        repo = match.group(1)
+        path = match.group(2) or "/"
+    path = SHA_PATTERN.sub("/:sha", path)
+    path = NUMBER_PATTERN.sub("/:number", path)
+    return repo, "%s %s" % (verb, path)
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of a list of values"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+class RequestStats(object):
+    """
+    Collector of the calls, latencies, retries, cache hits and rate limit
+    quota of the GitHub requests, shared between threads. Requests are
+    tagged with the current command and the repository found in their URL.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger("scc.stats")
+        self.dbg = self.log.debug
+        self.info = self.log.info
+        self.lock = threading.Lock()
+        self.command = None
+        self.clear()
+
+    def clear(self):
+        """Discard all statistics"""
+        self.calls = {}
+        self.retries = {}
+        self.quota_used = 0
+        self.remaining = None
+        self.reset = None
+
+    def record(self, verb, url, latency, cached=False, headers=None):
+        """Record a request"""
+        repo, endpoint = get_endpoint(verb, url)
+        key = (self.command, repo, endpoint)
+        with self.lock:
+            entry = self.calls.setdefault(key, {"latencies": [], "cached": 0})
+            entry["latencies"].append(latency)
+            if cached:
+                entry["cached"] += 1
+            if headers:
+                self.update_quota(headers)
+
+    def update_quota(self, headers):
+        """Accumulate the quota used from the rate limiting headers"""
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset = int(headers["x-ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+        if self.remaining is None:
+            pass
+        elif reset == self.reset:
+            self.quota_used += max(0, self.remaining - remaining)
+        else:
+            # The quota has been reset since the previous request
+            self.quota_used += limit - remaining
+        self.remaining = remaining
+        self.reset = reset
+
+    def record_retry(self, name):
+        """Record the retry of a failed call"""
+        key = (self.command, name)
+        with self.lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def get_summary(self):
+        """Return the statistics as a JSON-serializable dictionary"""
+        with self.lock:
+            endpoints = []
+            for key in sorted(self.calls, key=lambda x: [y or "" for y in x]):
+                command, repo, endpoint = key
+                latencies = self.calls[key]["latencies"]
+                endpoints.append({
+                    "command": command,
+                    "repository": repo,
+                    "endpoint": endpoint,
+                    "calls": len(latencies),
+                    "cached": self.calls[key]["cached"],
+                    "p50": percentile(latencies, 0.5),
+                    "p95": percentile(latencies, 0.95),
+                    "total": sum(latencies)})
+            retries = [{"command": k[0], "function": k[1], "retries": v}
+                       for k, v in sorted(self.retries.items())]
+            return {"endpoints": endpoints, "retries": retries,
+                    "quota_used": self.quota_used,
+                    "quota_remaining": self.remaining}
+
+    def format_summary(self, summary):
+        """Return the lines of a human-readable summary"""
+        lines = ["GitHub API calls:",
+                 "%6s %8s %8s %6s  %s" % (
+                     "Calls", "p50 (s)", "p95 (s)", "Cached", "Endpoint")]
+        for entry in summary["endpoints"]:
+            tags = [x for x in (entry["command"], entry["repository"]) if x]
+            lines.append("%6d %8.3f %8.3f %6d  %s [%s]" % (
+                entry["calls"], entry["p50"], entry["p95"], entry["cached"],
+                entry["endpoint"], " ".join(tags)))
+        lines.append("Retries: %s" % sum(
+            x["retries"] for x in summary["retries"]))
+        lines.append("Quota used: %s (remaining: %s)" % (
+            summary["quota_used"], summary["quota_remaining"]))
+        return lines
+
+    def report(self, filename=SCC_STATS_FILE):
+        """Log the summary and write it to filename if set"""
+        summary = self.get_summary()
+        if not summary["endpoints"] and not summary["retries"]:
+            return
+        for line in self.format_summary(summary):
+            self.info(line)
+        if filename:
+            try:
+                f = open(filename, "w")
+                try:
+                    json.dump(summary, f, indent=2)
+                finally:
+                    f.close()
+            except (IOError, OSError):
+                self.log.warn("Failed to write %s", filename, exc_info=1)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+HTTP connection classes used by PyGithub to talk to GitHub.
+
+PyGithub creates one connection per request through the connection classes
+registered with github.Requester.Requester.injectConnectionClasses. The
+classes below wrap the standard httplib connections in order to revalidate
+GET responses stored in a DiskCache using conditional requests, to pace
+requests according to the GitHub rate limits and to keep the underlying
+connections alive between requests.
+
+Environment variables:
+    SCC_RETRY_DELAY     default: 1 (seconds)
+    SCC_RATE_RESERVE    default: 10 (% of the rate limit)
+    SCC_POOL_SIZE       default: 8 (idle connections per host)
+
+"""
+
+import os
+import time
+import random
+import socket
+import httplib
+import logging
+import threading
+
+try:
+    from hashlib import sha1 as sha_new
+except ImportError:
+    from sha import new as sha_new
+
+
+try:
+    SCC_RETRY_DELAY = float(os.environ.get("SCC_RETRY_DELAY"))
+except:
+    SCC_RETRY_DELAY = 1.0
+try:
+    SCC_RATE_RESERVE = float(os.environ.get("SCC_RATE_RESERVE")) / 100
+except:
+    SCC_RATE_RESERVE = 0.1
+try:
+    SCC_POOL_SIZE = int(os.environ.get("SCC_POOL_SIZE"))
+except:
+    SCC_POOL_SIZE = 8
+
+
+def get_cache_key(host, url, headers):
+    """
+    Return the cache key of a request. Responses depend on the credentials
+    used, so the key includes a digest of the authorization header.
+    """
+    scope = sha_new(headers.get("Authorization", "")).hexdigest()
+    accept = headers.get("Accept", "")
+    return "%s %s %s %s" % (host, url, accept, scope)
+
+
+class CachedResponse(object):
+    """
+    Minimal replacement for httplib.HTTPResponse returning a stored body
+    """
+
+    def __init__(self, status, reason, headers, data):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.data
+
+
+class RequestScheduler(object):
+    """
+    Pacing of the requests sent to GitHub, shared between threads.
+
+    The remaining quota and its reset time are read from the headers of
+    every response. Once the remaining quota drops below the reserve
+    fraction of the limit, requests are spread evenly until the reset
+    time rather than exhausting the quota. Rate limited responses block
+    all requests until their Retry-After delay or the reset time has
+    passed. Failed requests are retried after a jittered exponential
+    backoff.
+    """
+
+    MAX_DELAY = 60  # Maximum backoff delay between retries
+
+    def __init__(self, delay=SCC_RETRY_DELAY, reserve=SCC_RATE_RESERVE):
+        self.log = logging.getLogger("scc.scheduler")
+        self.dbg = self.log.debug
+        self.delay = delay
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_time = 0
+        self.blocked_until = 0
+
+    def update(self, status, headers):
+        """Record the rate limiting information of a response"""
+        now = time.time()
+        with self.lock:
+            try:
+                self.limit = int(headers["x-ratelimit-limit"])
+                self.remaining = int(headers["x-ratelimit-remaining"])
+                self.reset = int(headers["x-ratelimit-reset"])
+            except (KeyError, ValueError):
+                pass
+
+            if status not in (403, 429):
+                return
+            blocked_until = None
+            if "retry-after" in headers:
+                try:
+                    blocked_until = now + int(headers["retry-after"])
+                except ValueError:
+                    pass
+            if blocked_until is None and self.remaining == 0 and \
+                    self.reset is not None:
+                blocked_until = self.reset
+            if blocked_until is not None and \
+                    blocked_until > self.blocked_until:
+                self.log.warn("Rate limited, pausing requests for %ds",
+                              blocked_until - now)
+                self.blocked_until = blocked_until
+
+    def get_interval(self, now):
+        """Return the minimal interval between two requests"""
+        if self.remaining is None or self.reset is None or \
+                not self.limit or self.reset <= now:
+            return 0
+        if self.remaining > self.limit * self.reserve:
+            return 0
+        return float(self.reset - now) / max(self.remaining, 1)
+
+    def wait(self):
+        """Block until the next request can be sent"""
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time, self.blocked_until)
+            self.next_time = start + self.get_interval(now)
+        if start > now:
+            self.dbg("Delaying request by %.2fs", start - now)
+            time.sleep(start - now)
+
+    def get_retry_delay(self, attempt):
+        """Return the jittered backoff delay before the given retry"""
+        delay = min(self.MAX_DELAY, float(self.delay) * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+
+class ConnectionPool(object):
+    """
+    Pool of persistent HTTP connections, shared between threads.
+
+    Connections are keyed by class, host and port. A connection is
+    returned to the pool once its response has been read entirely, so
+    that the next request to the same host skips the TCP and TLS
+    handshakes. Concurrent callers beyond the pool size get their own
+    connections, which are closed rather than kept when released.
+    """
+
+    def __init__(self, size=SCC_POOL_SIZE):
+        self.log = logging.getLogger("scc.http")
+        self.dbg = self.log.debug
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.handshakes = 0
+        self.reuses = 0
+
+    def acquire(self, connection_class, host, port=None, **kwargs):
+        """Return an idle connection or a new one and whether it is reused"""
+        key = (connection_class, host, port)
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                cnx = connections.pop()
+                if cnx.sock is not None:
+                    self.reuses += 1
+                    self.dbg("Reusing connection to %s (%s reuses)",
+                             host, self.reuses)
+                    return cnx, True
+            self.handshakes += 1
+            self.dbg("New connection to %s (%s handshakes)",
+                     host, self.handshakes)
+        return connection_class(host, port, **kwargs), False
+
+    def release(self, cnx, host, port=None):
+        """Keep a connection for later reuse or close it"""
+        key = (cnx.__class__, host, port)
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if cnx.sock is not None and len(connections) < self.size:
+                connections.append(cnx)
+                return
+        cnx.close()
+
+    def clear(self):
+        """Close all idle connections"""
+        with self.lock:
+            for connections in self.idle.values():
+                for cnx in connections:
+                    cnx.close()
+            self.idle = {}
+
+
+class GitHubConnection(object):
+    """
+    Wrapper around an httplib connection. If a cache is set, GET responses
+    carrying an ETag or Last-Modified header are stored and later
+    revalidated with If-None-Match/If-Modified-Since. A 304 answer, which
+    does not count against the GitHub rate limit, is then replaced by the
+    stored response.
+    """
+
+    connection_class = httplib.HTTPSConnection
+    cache = None
+    scheduler = None
+    pool = None
+    stats = None
+
+    def __init__(self, host, port=None, **kwargs):
+        self.log = logging.getLogger("scc.http")
+        self.dbg = self.log.debug
+        self.host = host
+        self.port = port
+        self.kwargs = kwargs
+        self.reused = False
+        if self.pool is not None:
+            self.cnx, self.reused = self.pool.acquire(
+                self.connection_class, host, port, **kwargs)
+        else:
+            self.cnx = self.connection_class(host, port, **kwargs)
+        self.response = None
+        self.key = None
+        self.entry = None
+
+    def reconnect(self):
+        """Replace a stale pooled connection by a new one"""
+        self.dbg("Stale connection to %s, reconnecting", self.host)
+        self.cnx.close()
+        self.cnx, self.reused = self.pool.acquire(
+            self.connection_class, self.host, self.port, **self.kwargs)
+
+    def send(self, *args):
+        """Send a request, retrying once if a reused connection was closed"""
+        try:
+            self.cnx.request(*args)
+            return self.cnx.getresponse()
+        except (httplib.BadStatusLine, socket.error):
+            if not self.reused:
+                raise
+        self.reconnect()
+        self.cnx.request(*args)
+        return self.cnx.getresponse()
+
+    def request(self, verb, url, body=None, headers=None):
+        if headers is None:
+            headers = {}
+        self.url = url
+        self.key = None
+        self.entry = None
+        self.verb = verb
+        if self.scheduler is not None:
+            self.scheduler.wait()
+        self.start = time.time()
+        if verb == "GET" and self.cache is not None:
+            self.key = get_cache_key(self.host, url, headers)
+            self.entry = self.cache.get(self.key)
+            if self.entry:
+                cached_headers = self.entry["headers"]
+                if "etag" in cached_headers:
+                    headers["If-None-Match"] = cached_headers["etag"]
+                if "last-modified" in cached_headers:
+                    headers["If-Modified-Since"] = \
+                        cached_headers["last-modified"]
+        self.response = self.send(verb, url, body, headers)
+
+    def getresponse(self):
+        response = self.response
+        headers = dict(response.getheaders())
+        if self.scheduler is not None:
+            self.scheduler.update(response.status, headers)
+        if self.stats is not None:
+            self.stats.record(
+                self.verb, self.url, time.time() - self.start,
+                cached=(response.status == 304 and bool(self.entry)),
+                headers=headers)
+        if self.key is None:
+            return response
+
+        data = response.read()
+        if response.status == 304 and self.entry:
+            self.dbg("Not modified: %s", self.url)
+            cached_headers = dict((str(k), str(v)) for k, v in
+                                  self.entry["headers"].items())
+            # Keep the rate limiting information of the live response
+            for key, value in headers.items():
+                if key.startswith("x-ratelimit"):
+                    cached_headers[key] = value
+            return CachedResponse(200, "OK", cached_headers,
+                                  self.entry["data"].encode("utf-8"))
+
+        if response.status == 200 and \
+                ("etag" in headers or "last-modified" in headers):
+            try:
+                self.cache.set(self.key, {
+                    "headers": headers,
+                    "data": data.decode("utf-8")})
+            except (IOError, OSError, UnicodeDecodeError):
+                self.dbg("Failed to cache %s", self.url, exc_info=1)
+        return CachedResponse(response.status, response.reason, headers,
+                              data)
+
+    def close(self):
+        if self.pool is None:
+            self.cnx.close()
+            return
+        # A connection can only be reused once its response has been read
+        isclosed = getattr(self.response, "isclosed", None)
+        if isclosed is None or isclosed():
+            self.pool.release(self.cnx, self.host, self.port)
+        else:
+            self.cnx.close()
+        self.response = None
+
+
+def get_connection_classes(cache=None, scheduler=None, pool=None,
+                           stats=None):
+    """
+    Return a pair of HTTP and HTTPS connection classes sharing the given
+    cache, scheduler, connection pool and statistics, as expected by
+    Requester.injectConnectionClasses.
+    """
+    http_class = type("HTTPConnection", (GitHubConnection,), {
+        "connection_class": httplib.HTTPConnection, "cache": cache,
+        "scheduler": scheduler, "pool": pool, "stats": stats})
+    https_class = type("HTTPSConnection", (GitHubConnection,), {
+        "connection_class": httplib.HTTPSConnection, "cache": cache,
+        "scheduler": scheduler, "pool": pool, "stats": stats})
+    return http_class, https_class
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import time
+import httplib
+import shutil
+import tempfile
+import unittest
+
+from scc.cache import DiskCache
+from scc.transport import CachedResponse, ConnectionPool, \
+    GitHubConnection, RequestScheduler
+
+
+class UnitTestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp("", "cache-")
+        self.cache = DiskCache(self.path, max_size=1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def testMissing(self):
+        self.assertEqual(self.cache.get("missing"), None)
+
+    def testSetGet(self):
+        self.cache.set("key", {"a": [1, 2]})
+        self.assertEqual(self.cache.get("key"), {"a": [1, 2]})
+
+    def testOverwrite(self):
+        self.cache.set("key", "old")
+        self.cache.set("key", "new")
+        self.assertEqual(self.cache.get("key"), "new")
+        self.assertEqual(len(self.cache.list_entries()), 1)
+
+    def testDelete(self):
+        self.cache.set("key", "value")
+        self.cache.delete("key")
+        self.assertEqual(self.cache.get("key"), None)
+
+    def testMaxAge(self):
+        self.cache.set("key", "value")
+        self.assertEqual(self.cache.get("key", max_age=60), "value")
+        self.assertEqual(self.cache.get("key", max_age=-1), None)
+
+    def testLRUEviction(self):
+        value = "x" * 400
+        self.cache.set("first", value)
+        self.cache.set("second", value)
+        # Make first the most recently used entry
+        past = time.time() - 100
+        os.utime(self.cache.get_filename("second"), (past, past))
+        self.cache.get("first")
+        self.cache.set("third", value)
+        self.assertEqual(self.cache.get("first"), value)
+        self.assertEqual(self.cache.get("second"), None)
+        self.assertEqual(self.cache.get("third"), value)
+
+
+class MockConnection(object):
+
+    responses = []
+    requests = []
+
+    def __init__(self, host, port=None, **kwargs):
+        self.sock = object()
+
+    def request(self, verb, url, body=None, headers=None):
+        self.requests.append((verb, url, dict(headers)))
+
+    def getresponse(self):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        self.sock = None
+
+
+class UnitTestGitHubConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp("", "cache-")
+        self.cache = DiskCache(self.path)
+        MockConnection.requests = []
+        MockConnection.responses = []
+
+        class Connection(GitHubConnection):
+            connection_class = MockConnection
+            cache = self.cache
+        self.cnx_class = Connection
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get(self, url="/repos/mock/mock/pulls", token="token mock"):
+        cnx = self.cnx_class("api.github.com", 443)
+        cnx.request("GET", url, "null", {"Authorization": token})
+        response = cnx.getresponse()
+        cnx.close()
+        return response
+
+    def respond(self, status, headers, data=""):
+        MockConnection.responses.append(
+            CachedResponse(status, "", headers, data))
+
+    def testStoreAndRevalidate(self):
+        self.respond(200, {"etag": '"abc"', "x-ratelimit-remaining": "10"},
+                     '[1]')
+        self.respond(304, {"x-ratelimit-remaining": "9"})
+        self.assertEqual(self.get().read(), '[1]')
+        response = self.get()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), '[1]')
+        self.assertEqual(response.getheader("x-ratelimit-remaining"), "9")
+        self.assertFalse("If-None-Match" in MockConnection.requests[0][2])
+        self.assertEqual(MockConnection.requests[1][2]["If-None-Match"],
+                         '"abc"')
+
+    def testModifiedResponse(self):
+        self.respond(200, {"last-modified": "Mon"}, '[1]')
+        self.respond(200, {"last-modified": "Tue"}, '[2]')
+        self.respond(304, {})
+        self.assertEqual(self.get().read(), '[1]')
+        self.assertEqual(self.get().read(), '[2]')
+        self.assertEqual(self.get().read(), '[2]')
+        self.assertEqual(MockConnection.requests[2][2]["If-Modified-Since"],
+                         "Tue")
+
+    def testTokenScope(self):
+        self.respond(200, {"etag": '"abc"'}, '[1]')
+        self.respond(200, {"etag": '"def"'}, '[2]')
+        self.get(token="token a")
+        self.get(token="token b")
+        self.assertFalse("If-None-Match" in MockConnection.requests[1][2])
+
+    def testNoValidator(self):
+        self.respond(200, {}, '[1]')
+        self.respond(200, {}, '[1]')
+        self.get()
+        self.get()
+        self.assertFalse("If-None-Match" in MockConnection.requests[1][2])
+
+
+class UnitTestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        MockConnection.requests = []
+        MockConnection.responses = []
+        self.pool = ConnectionPool(size=1)
+
+        class Connection(GitHubConnection):
+            connection_class = MockConnection
+            pool = self.pool
+        self.cnx_class = Connection
+
+    def get(self):
+        cnx = self.cnx_class("api.github.com", 443)
+        cnx.request("GET", "/user", "null", {})
+        response = cnx.getresponse()
+        cnx.close()
+        return cnx, response
+
+    def respond(self, data):
+        MockConnection.responses.append(CachedResponse(200, "", {}, data))
+
+    def testReuse(self):
+        self.respond("[1]")
+        self.respond("[2]")
+        first, response = self.get()
+        second, response = self.get()
+        self.assertEqual(response.read(), "[2]")
+        self.assertTrue(first.cnx is second.cnx)
+        self.assertEqual(self.pool.handshakes, 1)
+        self.assertEqual(self.pool.reuses, 1)
+
+    def testPoolSize(self):
+        first = self.cnx_class("api.github.com", 443)
+        second = self.cnx_class("api.github.com", 443)
+        first.close()
+        second.close()
+        self.assertEqual(self.pool.handshakes, 2)
+        self.assertEqual(first.cnx.sock is None, False)
+        self.assertEqual(second.cnx.sock, None)
+
+    def testStaleConnection(self):
+        self.respond("[1]")
+        MockConnection.responses.append(httplib.BadStatusLine(""))
+        self.respond("[2]")
+        first, response = self.get()
+        second, response = self.get()
+        self.assertEqual(response.read(), "[2]")
+        self.assertEqual(self.pool.handshakes, 2)
+        self.assertEqual(len(MockConnection.requests), 3)
+
+    def testNewConnectionError(self):
+        MockConnection.responses.append(IOError())
+        self.assertRaises(IOError, self.get)
+
+
+class UnitTestRequestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler(delay=1, reserve=0.1)
+        self.now = time.time()
+
+    def headers(self, remaining, reset=100, limit=1000, **kwargs):
+        headers = {"x-ratelimit-limit": str(limit),
+                   "x-ratelimit-remaining": str(remaining),
+                   "x-ratelimit-reset": str(int(self.now + reset))}
+        headers.update(kwargs)
+        return headers
+
+    def testQuota(self):
+        self.scheduler.update(200, self.headers(500))
+        self.assertEqual(self.scheduler.remaining, 500)
+        self.assertEqual(self.scheduler.get_interval(self.now), 0)
+        self.scheduler.wait()
+        self.assertEqual(self.scheduler.blocked_until, 0)
+
+    def testLowQuota(self):
+        self.scheduler.update(200, self.headers(50))
+        interval = self.scheduler.get_interval(self.now)
+        self.assertTrue(1 < interval <= 2)
+
+    def testRetryAfter(self):
+        self.scheduler.update(403, self.headers(500, **{"retry-after": "30"}))
+        self.assertTrue(self.scheduler.blocked_until >= self.now + 30)
+
+    def testExhausted(self):
+        self.scheduler.update(403, self.headers(0, reset=60))
+        self.assertEqual(self.scheduler.blocked_until, int(self.now + 60))
+
+    def testForbidden(self):
+        self.scheduler.update(403, self.headers(500))
+        self.assertEqual(self.scheduler.blocked_until, 0)
+
+    def testRetryDelay(self):
+        for attempt in range(3):
+            delay = self.scheduler.get_retry_delay(attempt)
+            self.assertTrue(2 ** attempt / 2.0 <= delay <= 2 ** attempt)
+        self.assertTrue(self.scheduler.get_retry_delay(20) <=
+                        RequestScheduler.MAX_DELAY)
+
+    def testConnection(self):
+        class Connection(GitHubConnection):
+            connection_class = MockConnection
+            scheduler = self.scheduler
+        MockConnection.requests = []
+        MockConnection.responses = [
+            CachedResponse(200, "", self.headers(42), "[]")]
+        cnx = Connection("api.github.com", 443)
+        cnx.request("GET", "/user", "null", {})
+        self.assertEqual(cnx.getresponse().read(), "[]")
+        self.assertEqual(self.scheduler.remaining, 42)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig()
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import time
+import shutil
+import tempfile
+import unittest
+
+from scc.cache import DiskCache
+from github.IssueComment import IssueComment
+from scc.git import CommentIndex, PullRequest
+
+
+class FailingRequester(object):
+
+    def requestJsonAndCheck(self, *args, **kwargs):
+        raise AssertionError("Unexpected request: %s %s" % args[:2])
+
+
+def MockComment(id, number, body, updated_at, login="user"):
+    raw_data = {
+        "id": id,
+        "body": body,
+        "url": "https://api.github.com/repos/mock/mock/issues/comments/%s"
+        % id,
+        "issue_url": "https://api.github.com/repos/mock/mock/issues/%s"
+        % number,
+        "created_at": updated_at,
+        "updated_at": updated_at,
+        "user": {"login": login, "id": 1, "avatar_url": "mock"},
+        }
+    # Listed comments are incomplete and must not be fetched again
+    return IssueComment(FailingRequester(), {}, raw_data, completed=False)
+
+
+class MockRepository(object):
+
+    def __init__(self):
+        self.comments = []
+        self.requests = []
+
+    def get_issues_comments(self, **kwargs):
+        self.requests.append(kwargs)
+        since = kwargs.get("since")
+        if since:
+            since = since.strftime(CommentIndex.DATE_FORMAT)
+        return [x for x in self.comments
+                if since is None or x._rawData["updated_at"] >= since]
+
+
+class MockGHManager(object):
+
+    def create_from_raw_data(self, klass, raw_data):
+        return klass(None, {}, raw_data, completed=True)
+
+
+class MockGitHubRepository(object):
+
+    user_name = "mock"
+    repo_name = "mock"
+
+    def __init__(self):
+        self.gh = MockGHManager()
+        self.repo = MockRepository()
+
+
+class MockPull(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.body = ""
+
+
+class UnitTestCommentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp("", "cache-")
+        self.cache = DiskCache(self.path)
+        self.gh_repo = MockGitHubRepository()
+        self.repo = self.gh_repo.repo
+        self.repo.comments = [
+            MockComment(2, 1, "--exclude", "2013-11-02T00:00:00Z"),
+            MockComment(1, 1, "first", "2013-11-01T00:00:00Z"),
+            MockComment(3, 2, "--test dir", "2013-11-03T00:00:00Z"),
+            ]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_bodies(self, index, number):
+        return [x.body for x in index.get_comments(number)]
+
+    def testGetComments(self):
+        index = CommentIndex(self.gh_repo, self.cache)
+        self.assertEqual(self.get_bodies(index, 1), ["first", "--exclude"])
+        self.assertEqual(self.get_bodies(index, 2), ["--test dir"])
+        self.assertEqual(self.get_bodies(index, 3), [])
+        self.assertEqual(len(self.repo.requests), 1)
+        self.assertEqual(index.get_comments(1)[0].user.login, "user")
+
+    def testIncrementalSync(self):
+        index = CommentIndex(self.gh_repo, self.cache)
+        self.get_bodies(index, 1)
+        self.repo.comments.append(
+            MockComment(4, 1, "new", "2013-11-04T00:00:00Z"))
+        self.repo.comments[0] = MockComment(2, 1, "edited",
+                                            "2013-11-05T00:00:00Z")
+        index.invalidate()
+        self.assertEqual(self.get_bodies(index, 1),
+                         ["first", "edited", "new"])
+        self.assertEqual(self.repo.requests[1]["since"].day, 3)
+
+    def testPersistence(self):
+        index = CommentIndex(self.gh_repo, self.cache)
+        self.get_bodies(index, 1)
+        index = CommentIndex(self.gh_repo, self.cache)
+        self.assertEqual(self.get_bodies(index, 2), ["--test dir"])
+        self.assertEqual(self.repo.requests[1]["since"].day, 3)
+
+    def testExpiry(self):
+        index = CommentIndex(self.gh_repo, self.cache)
+        index.created = time.time() - CommentIndex.MAX_AGE - 1
+        self.get_bodies(index, 1)
+        index = CommentIndex(self.gh_repo, self.cache)
+        self.get_bodies(index, 1)
+        self.assertFalse("since" in self.repo.requests[1])
+
+    def testPullRequest(self):
+        index = CommentIndex(self.gh_repo, self.cache)
+        pr = PullRequest(MockPull(2), comment_index=index)
+        self.assertEqual(pr.parse_comments("test"), [" dir"])
+        pr = PullRequest(MockPull(1), comment_index=index)
+        self.assertEqual(pr.parse("exclude"), [""])
+        self.assertEqual(len(self.repo.requests), 1)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig()
+    unittest.main()
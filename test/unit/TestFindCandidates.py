@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import time
+import random
+import unittest
+
+from github.Issue import Issue
+from github.Label import Label
+from scc.git import parallel_map, StatusResolver
+from Mock import MockTest
+
+
+class MockUser(object):
+
+    def __init__(self, login):
+        self.login = login
+
+
+class MockPull(object):
+
+    def __init__(self, number, login="test", body=""):
+        self.number = number
+        self.user = MockUser(login)
+        self.title = "title %s" % number
+        self.body = body
+
+
+class UnitTestParallelMap(unittest.TestCase):
+
+    def slow_square(self, x):
+        time.sleep(random.random() / 100)
+        return x * x
+
+    def testSerial(self):
+        self.assertEqual(parallel_map(self.slow_square, range(5)),
+                         [0, 1, 4, 9, 16])
+
+    def testParallelOrder(self):
+        self.assertEqual(parallel_map(self.slow_square, range(20), jobs=4),
+                         [x * x for x in range(20)])
+
+    def testEmpty(self):
+        self.assertEqual(parallel_map(self.slow_square, [], jobs=4), [])
+
+    def testException(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        self.assertRaises(ValueError, parallel_map, fail, range(5), 2)
+
+
+class UnitTestFindCandidates(MockTest):
+
+    def setUp(self):
+        MockTest.setUp(self)
+        self.filters = {
+            "base": "master",
+            "default": "all",
+            "include": {"label": None, "user": None, "pr": None},
+            "exclude": {"label": None, "user": None, "pr": None},
+            }
+        self.pulls = [MockPull(n) for n in (5, 3, 8, 1, 2)]
+        self.excluded = [3, 8]
+        self.gh_repo.get_pulls_by_base = lambda base: self.pulls
+        self.gh_repo.get_exclusion_reason = self.get_exclusion_reason
+
+    def get_exclusion_reason(self, pullrequest, pipeline):
+        time.sleep(random.random() / 100)
+        if pullrequest.get_number() in self.excluded:
+            return "pr: %s" % pullrequest.get_number()
+        return None
+
+    def find_candidates(self, jobs):
+        msg = self.gh_repo.find_candidates(self.filters, jobs=jobs)
+        numbers = [x.get_number() for x in self.gh_repo.candidate_pulls]
+        return msg, numbers
+
+    def testSerial(self):
+        msg, numbers = self.find_candidates(1)
+        self.assertEqual(numbers, [1, 2, 5])
+        self.assertEqual(msg, "Excluded PRs:\n"
+                         "  # PR 3 test 'title 3' (pr: 3)\n"
+                         "  # PR 8 test 'title 8' (pr: 8)\n")
+
+    def testParallel(self):
+        serial_msg, serial_numbers = self.find_candidates(1)
+        self.gh_repo.candidate_pulls = []
+        msg, numbers = self.find_candidates(4)
+        self.assertEqual(numbers, serial_numbers)
+        self.assertEqual(msg, serial_msg)
+
+
+class MockRequester(object):
+
+    per_page = 100
+
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def requestJsonAndCheck(self, verb, url, parameters=None, headers=None,
+                            input=None, cnx=None):
+        self.requests.append((verb, url, parameters))
+        return {}, self.data
+
+
+class UnitTestListPulls(MockTest):
+
+    def setUp(self):
+        MockTest.setUp(self)
+        self.requester = MockRequester([
+            {"number": 1, "base": {"ref": "master"},
+             "head": {"ref": "topic"}},
+            {"number": 2, "base": {"ref": "develop"},
+             "head": {"ref": "other"}},
+            ])
+        self.repo._requester = self.requester
+        self.repo.url = "/repos/mock/mock"
+
+    def testPullsByBase(self):
+        pulls = self.gh_repo.get_pulls_by_base("master")
+        self.assertEqual([x.number for x in pulls], [1])
+        self.assertEqual(self.requester.requests, [
+            ("GET", "/repos/mock/mock/pulls",
+             {"state": "open", "base": "master", "per_page": 100})])
+
+    def testPullsByHead(self):
+        pulls = self.gh_repo.get_pulls_by_head("user", "other")
+        self.assertEqual([x.number for x in pulls], [2])
+        self.assertEqual(self.requester.requests, [
+            ("GET", "/repos/mock/mock/pulls",
+             {"state": "open", "head": "user:other", "per_page": 100})])
+
+
+class UnitTestLabelIndex(MockTest):
+
+    def create_issue(self, number, labels):
+        issue = self.mox.CreateMock(Issue)
+        issue.number = number
+        issue.labels = []
+        for name in labels:
+            label = self.mox.CreateMock(Label)
+            label.name = name
+            issue.labels.append(label)
+        return issue
+
+    def testBuildLabelIndex(self):
+        self.mox.ResetAll()
+        issues = [self.create_issue(1, ["a", "b"]), self.create_issue(2, [])]
+        self.repo.get_issues(state="open").AndReturn(issues)
+        self.mox.ReplayAll()
+        self.assertEqual(self.gh_repo.build_label_index(),
+                         {1: ["a", "b"], 2: []})
+        self.assertEqual(self.gh_repo.label_index, {1: ["a", "b"], 2: []})
+
+
+class MockStatusRepository(object):
+
+    def __init__(self, full_name, states):
+        self.full_name = full_name
+        self.url = "/repos/" + full_name
+        self.states = states
+        self._requester = self
+        self.requests = []
+
+    def requestJsonAndCheck(self, verb, url):
+        self.requests.append(url)
+        sha = url.split("/")[-2]
+        if sha not in self.states:
+            return {}, {"state": "pending", "total_count": 0}
+        return {}, {"state": self.states[sha], "total_count": 1}
+
+
+class MockPullRequest(object):
+
+    def __init__(self, number, login="test", labels=[], comments=[],
+                 base=None, head=None, sha="abc"):
+        self.number = number
+        self.user = MockUser(login)
+        self.labels = labels
+        self.comments = comments
+        self.repos = {"base": base, "head": head}
+        self.sha = sha
+        self.calls = []
+
+    def get_number(self):
+        return self.number
+
+    def get_user(self):
+        return self.user
+
+    def get_login(self):
+        return self.user.login
+
+    def get_labels(self):
+        self.calls.append("labels")
+        return self.labels
+
+    def parse(self, argument, whitelist=lambda x: True):
+        self.calls.append("comments")
+        return [x for x in self.comments if x == argument]
+
+    def get_repo(self, ref="base"):
+        self.calls.append("status")
+        return self.repos[ref]
+
+    def get_sha(self):
+        return self.sha
+
+
+class UnitTestFilterPipeline(MockTest):
+
+    def setUp(self):
+        MockTest.setUp(self)
+        self.filters = {
+            "base": "master",
+            "default": "all",
+            "status": "none",
+            "include": {"label": ["include"], "user": None, "pr": None},
+            "exclude": {"label": ["exclude"], "user": None, "pr": None},
+            }
+
+    def get_reason(self, pullrequest):
+        pipeline = self.gh_repo.get_filter_pipeline(self.filters)
+        return self.gh_repo.get_exclusion_reason(pullrequest, pipeline)
+
+    def testCostOrder(self):
+        self.filters["exclude"]["user"] = ["test"]
+        self.filters["status"] = "success-only"
+        pipeline = self.gh_repo.get_filter_pipeline(self.filters)
+        costs = [cost for cost, stage in pipeline]
+        self.assertEqual(costs, sorted(costs))
+        self.assertEqual(costs[0], 0)
+
+    def testCandidate(self):
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), None)
+        self.assertEqual(pullrequest.calls, ["labels", "comments"])
+
+    def testExcludeUser(self):
+        self.filters["exclude"]["user"] = ["test"]
+        pullrequest = MockPullRequest(1, comments=["exclude"])
+        self.assertEqual(self.get_reason(pullrequest), "user: test")
+        self.assertEqual(pullrequest.calls, [])
+
+    def testExcludePR(self):
+        self.filters["exclude"]["pr"] = ["1"]
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), "pr: 1")
+        self.assertEqual(pullrequest.calls, [])
+
+    def testExcludeLabel(self):
+        pullrequest = MockPullRequest(1, labels=["Exclude"],
+                                      comments=["exclude"])
+        self.assertEqual(self.get_reason(pullrequest), "label: exclude")
+        self.assertEqual(pullrequest.calls, ["labels"])
+
+    def testExcludeComment(self):
+        pullrequest = MockPullRequest(1, comments=["exclude"])
+        self.assertEqual(self.get_reason(pullrequest), "exclude comment")
+
+    def testNoLabelFilters(self):
+        self.filters["include"]["label"] = None
+        self.filters["exclude"]["label"] = None
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), None)
+        self.assertEqual(pullrequest.calls, ["comments"])
+
+    def testNotWhitelisted(self):
+        self.filters["default"] = "none"
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), "user: test")
+        self.assertEqual(pullrequest.calls, ["labels"])
+
+    def testIncludePR(self):
+        self.filters["default"] = "none"
+        self.filters["include"]["pr"] = ["1"]
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), None)
+        self.assertEqual(pullrequest.calls, ["labels", "comments"])
+
+    def testIncludeLabel(self):
+        self.filters["default"] = "none"
+        pullrequest = MockPullRequest(1, labels=["include"])
+        self.assertEqual(self.get_reason(pullrequest), None)
+
+    def testStatus(self):
+        self.filters["status"] = "success-only"
+        pullrequest = MockPullRequest(1)
+        self.assertEqual(self.get_reason(pullrequest), "status: ")
+        self.assertEqual(pullrequest.calls[-3:],
+                         ["comments", "status", "status"])
+
+    def testStatusFallback(self):
+        self.filters["status"] = "success-only"
+        base = MockStatusRepository("mock/mock", {})
+        head = MockStatusRepository("user/mock", {"abc": "success"})
+        pullrequest = MockPullRequest(1, base=base, head=head)
+        self.assertEqual(self.get_reason(pullrequest), None)
+        self.assertEqual(base.requests,
+                         ["/repos/mock/mock/commits/abc/status"])
+        self.assertEqual(head.requests,
+                         ["/repos/user/mock/commits/abc/status"])
+
+    def testStatusNoError(self):
+        self.filters["status"] = "no-error"
+        base = MockStatusRepository("mock/mock", {"abc": "failure"})
+        pullrequest = MockPullRequest(1, base=base, head=base)
+        self.assertEqual(self.get_reason(pullrequest), "status: failure")
+
+
+class UnitTestStatusResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = StatusResolver()
+        self.base = MockStatusRepository("mock/mock", {"a": "success"})
+        self.fork = MockStatusRepository("user/mock", {"b": "failure"})
+
+    def testSameRepository(self):
+        # Base and head share the lookup of an unknown status
+        pullrequest = MockPullRequest(1, base=self.base, head=self.base,
+                                      sha="b")
+        self.assertEqual(self.resolver.resolve(pullrequest), None)
+        self.assertEqual(len(self.base.requests), 1)
+
+    def testPrefetch(self):
+        pullrequests = [
+            MockPullRequest(1, base=self.base, head=self.fork, sha="a"),
+            MockPullRequest(2, base=self.base, head=self.fork, sha="b"),
+            MockPullRequest(3, base=self.base, head=self.fork, sha="b"),
+            MockPullRequest(4, base=self.base, head=None, sha="c"),
+            ]
+        self.resolver.prefetch(pullrequests, jobs=4)
+        self.assertEqual(sorted(self.base.requests), [
+            "/repos/mock/mock/commits/a/status",
+            "/repos/mock/mock/commits/b/status",
+            "/repos/mock/mock/commits/c/status"])
+        self.assertEqual(self.fork.requests, [
+            "/repos/user/mock/commits/b/status"])
+        states = [self.resolver.resolve(x) for x in pullrequests]
+        self.assertEqual(states, ["success", "failure", "failure", None])
+        self.assertEqual(len(self.base.requests), 3)
+        self.assertEqual(len(self.fork.requests), 1)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig()
+    unittest.main()
@@ -0,0 +1,657 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import time
+import random
+import difflib
+import shutil
+import tempfile
+import unittest
+
+from subprocess import Popen, PIPE
+from scc.cache import DiskCache
+from scc.git import GitRepository, format_conflict_matrix
+
+
+class LocalRepositoryTest(unittest.TestCase):
+    """
+    Base class for tests running against a local git repository whose
+    origin remote points to GitHub.
+    """
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.path = os.path.abspath(tempfile.mkdtemp("", "repo-"))
+        self.git("init", "-q")
+        self.git("symbolic-ref", "HEAD", "refs/heads/master")
+        self.git("config", "user.name", "scc")
+        self.git("config", "user.email", "scc@example.com")
+        self.git("remote", "add", "origin", "git@github.com:mock/mock.git")
+        self.commit("first")
+        self.repo = GitRepository(None, self.path)
+
+    def tearDown(self):
+        try:
+            self.repo.cleanup()
+        finally:
+            os.chdir(self.cwd)
+            shutil.rmtree(self.path)
+
+    def git(self, *args):
+        p = Popen(("git",) + args, cwd=self.path, stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate()
+        self.assertEqual(p.returncode, 0, err)
+        return out.strip()
+
+    def commit(self, message):
+        self.git("commit", "-q", "--allow-empty", "-m", message)
+        return self.git("rev-parse", "HEAD")
+
+
+class TestWorkingDirectory(LocalRepositoryTest):
+
+    def testNoChdir(self):
+        other = tempfile.mkdtemp("", "cwd-")
+        try:
+            os.chdir(other)
+            repo = GitRepository(None, self.path)
+            repo.new_branch("topic")
+            repo.add_remote("other", "git@github.com:other/mock.git")
+            self.assertEqual(repo.get_current_head(), "topic")
+            self.assertEqual(repo.get_remote_url("other"),
+                             "git@github.com:other/mock.git")
+            self.assertEqual(os.getcwd(), os.path.realpath(other))
+        finally:
+            os.chdir(self.cwd)
+            shutil.rmtree(other)
+
+    def testSubdirectory(self):
+        subdirectory = os.path.join(self.path, "sub")
+        os.mkdir(subdirectory)
+        repo = GitRepository(None, subdirectory)
+        self.assertEqual(repo.path, os.path.realpath(self.path))
+
+
+class TestCatFile(LocalRepositoryTest):
+
+    def testGetSha1(self):
+        sha1 = self.git("rev-parse", "HEAD")
+        self.assertEqual(self.repo.get_sha1("HEAD"), sha1)
+        self.assertEqual(self.repo.get_sha1("master"), sha1)
+        self.assertEqual(self.repo.get_current_sha1(), sha1)
+        self.assertRaises(Exception, self.repo.get_sha1, "missing")
+
+    def testHasRef(self):
+        self.assertTrue(self.repo.has_ref("refs/heads/master"))
+        self.assertTrue(self.repo.has_local_branch("master"))
+        self.assertFalse(self.repo.has_local_branch("missing"))
+        self.assertFalse(self.repo.has_local_tag("v1"))
+        self.repo.tag("v1")
+        self.assertTrue(self.repo.has_local_tag("v1"))
+        self.assertFalse(self.repo.has_remote_branch("master"))
+
+    def testHasLocalObject(self):
+        self.assertTrue(self.repo.has_local_object(self.commit("second")))
+        self.assertFalse(self.repo.has_local_object("0" * 40))
+
+    def testReadObject(self):
+        sha1 = self.commit("second")
+        type, content = self.repo.read_object(sha1)
+        self.assertEqual(type, "commit")
+        self.assertTrue(content.endswith("second\n"))
+        self.assertEqual(self.repo.read_object("0" * 40), None)
+
+    def testSingleProcess(self):
+        self.repo.get_sha1("master")
+        process = self.repo.batch_check.process
+        self.repo.has_local_object("0" * 40)
+        self.assertTrue(self.repo.batch_check.process is process)
+        self.repo.cleanup()
+        self.assertEqual(self.repo.batch_check.process, None)
+        self.assertEqual(process.returncode, 0)
+
+    def testRestart(self):
+        self.repo.get_sha1("master")
+        self.repo.batch_check.process.kill()
+        self.repo.batch_check.process.wait()
+        self.assertTrue(self.repo.has_local_object("master"))
+
+
+class TestRefSnapshot(LocalRepositoryTest):
+
+    def setUp(self):
+        LocalRepositoryTest.setUp(self)
+        self.calls = []
+        communicate = self.repo.communicate
+
+        def counting_communicate(*command):
+            self.calls.append(command[1])
+            return communicate(*command)
+        self.repo.communicate = counting_communicate
+
+    def testSingleCall(self):
+        self.assertTrue(self.repo.has_local_branch("master"))
+        self.assertFalse(self.repo.has_local_branch("topic"))
+        self.assertFalse(self.repo.has_remote_branch("master"))
+        self.assertEqual(self.repo.get_current_head(), "master")
+        self.assertEqual(self.calls, ["for-each-ref"])
+
+    def testNewBranch(self):
+        self.assertFalse(self.repo.has_local_branch("topic"))
+        self.repo.new_branch("topic")
+        self.assertTrue(self.repo.has_local_branch("topic"))
+        self.assertEqual(self.repo.get_current_head(), "topic")
+        self.repo.checkout_branch("master")
+        self.assertEqual(self.repo.get_current_head(), "master")
+        self.repo.delete_local_branch("topic")
+        self.assertFalse(self.repo.has_local_branch("topic"))
+
+    def testDetachedHead(self):
+        self.git("checkout", "-q", "--detach")
+        self.repo.invalidate_refs()
+        self.assertRaises(Exception, self.repo.get_current_head)
+
+    def testRemotes(self):
+        self.assertEqual(self.repo.list_remotes(), ["origin"])
+        self.repo.add_remote("other", "git@github.com:other/mock.git")
+        self.assertEqual(self.repo.list_remotes(), ["origin", "other"])
+
+    def testReadOnlyCalls(self):
+        self.repo.get_refs()
+        self.repo.has_local_changes()
+        self.repo.merge_base("master", "master")
+        self.assertTrue(self.repo.refs is not None)
+
+
+class TestListMerged(LocalRepositoryTest):
+
+    def branch(self, name, message, date):
+        self.git("checkout", "-q", "-b", name, "master")
+        env = os.environ.copy()
+        env["GIT_COMMITTER_DATE"] = date
+        p = Popen(["git", "commit", "-q", "--allow-empty", "-m", message],
+                  cwd=self.path, env=env)
+        self.assertEqual(p.wait(), 0)
+        self.git("checkout", "-q", "master")
+
+    def testListMerged(self):
+        self.branch("old", "old work", "2013-01-01T00:00:00 +0000")
+        self.branch("new", "new work", "2013-02-01T00:00:00 +0000")
+        self.branch("open", "open work", "2013-01-15T00:00:00 +0000")
+        self.git("merge", "-q", "--ff-only", "old")
+        self.git("merge", "-q", "--no-ff", "-m", "merge new", "new")
+        self.git("tag", "-a", "-m", "annotated", "v1", "old")
+        lines = self.repo.list_merged("master", ["refs/heads", "refs/tags"])
+        names = [x.split(" ")[3] for x in lines]
+        self.assertEqual(names, ["old", "new", "master"])
+        self.assertTrue(lines[0].startswith("2013-01-01 00:00:00 +0000 old"))
+        self.assertTrue(lines[0].endswith("   --- old work"))
+
+
+class TestFindBranchingPoint(LocalRepositoryTest):
+
+    def difflib_branching_point(self, topic_branch, main_branch):
+        topic_revlist = self.repo.get_rev_list(topic_branch)
+        main_revlist = self.repo.get_rev_list(main_branch)
+        s = difflib.SequenceMatcher(None, topic_revlist, main_revlist)
+        return main_revlist[s.get_matching_blocks()[0].b]
+
+    def assertBranchingPoint(self, topic_branch, main_branch, sha1):
+        self.assertEqual(
+            self.repo.find_branching_point(topic_branch, main_branch), sha1)
+        self.assertEqual(
+            self.difflib_branching_point(topic_branch, main_branch), sha1)
+
+    def testTopicBranch(self):
+        base = self.commit("base")
+        self.git("checkout", "-q", "-b", "topic")
+        for i in range(3):
+            self.commit("topic %s" % i)
+        self.git("checkout", "-q", "master")
+        for i in range(5):
+            self.commit("master %s" % i)
+        self.assertBranchingPoint("topic", "master", base)
+        self.assertBranchingPoint("master", "topic", base)
+
+    def testMergedMain(self):
+        base = self.commit("base")
+        self.git("checkout", "-q", "-b", "topic")
+        self.commit("topic")
+        self.git("checkout", "-q", "master")
+        self.commit("master")
+        self.git("checkout", "-q", "topic")
+        self.git("merge", "-q", "--no-ff", "-m", "merge master", "master")
+        self.commit("topic again")
+        self.assertBranchingPoint("topic", "master", base)
+
+    def testSameBranch(self):
+        head = self.commit("head")
+        self.assertBranchingPoint("master", "master", head)
+
+    def testAncestor(self):
+        base = self.commit("base")
+        self.git("branch", "old")
+        self.commit("new")
+        self.assertBranchingPoint("master", "old", base)
+
+    def testUnknownBranch(self):
+        self.assertRaises(Exception, self.repo.find_branching_point,
+                          "master", "missing")
+
+
+class TestRevList(LocalRepositoryTest):
+
+    def setUp(self):
+        LocalRepositoryTest.setUp(self)
+        self.sha1s = [self.commit("commit %s" % i) for i in range(3)]
+        self.sha1s.reverse()
+
+    def testGetRevList(self):
+        revlist = self.repo.get_rev_list("master")
+        self.assertEqual(revlist[:3], self.sha1s)
+        self.assertEqual(len(revlist), 4)
+
+    def testIterRevList(self):
+        revlist = self.repo.iter_rev_list("master")
+        self.assertEqual(next(revlist), self.sha1s[0])
+        self.assertEqual(next(revlist), self.sha1s[1])
+        revlist.close()
+
+    def testError(self):
+        self.assertRaises(Exception, self.repo.get_rev_list, "missing")
+
+
+class MockOrigin(object):
+
+    def __init__(self, name):
+        self.user_name = "mock"
+        self.repo_name = name
+
+    def __str__(self):
+        return "Repository: mock/%s" % self.repo_name
+
+    def find_candidates(self, filters, jobs=1):
+        return ""
+
+    def merge_info(self):
+        return ""
+
+
+class MockSubmodule(object):
+
+    def __init__(self, name):
+        self.origin = MockOrigin(name)
+        self.calls = []
+
+    def rmerge(self, filters, *args, **kwargs):
+        time.sleep(random.random() / 50)
+        self.calls.append((filters["include"]["pr"], kwargs["jobs"]))
+        return False, str(self.origin) + "\n"
+
+
+class TestRecursiveMerge(LocalRepositoryTest):
+
+    def setUp(self):
+        LocalRepositoryTest.setUp(self)
+        self.filters = {
+            "base": "master",
+            "include": {"label": None, "user": None,
+                        "pr": ["mock/sub1#2", "3"]},
+            "exclude": {"label": None, "user": None, "pr": None},
+            }
+        self.repo.origin = MockOrigin("mock")
+        self.repo.submodules = [MockSubmodule("sub%s" % i) for i in range(6)]
+
+    def rmerge(self, jobs):
+        updated, msg = self.repo.rmerge(self.filters, info=True, jobs=jobs)
+        return msg
+
+    def testParallelOrder(self):
+        self.assertEqual(self.rmerge(4), self.rmerge(1))
+        self.assertEqual(self.rmerge(4).split("\n")[2],
+                         "Repository: mock/sub0")
+
+    def testSubmoduleFilters(self):
+        self.rmerge(3)
+        self.assertEqual(self.repo.submodules[1].calls, [(["#2"], 3)])
+        self.assertEqual(self.repo.submodules[2].calls, [(None, 3)])
+
+
+class MockPull(object):
+
+    def __init__(self, number, sha):
+        self.number = number
+        self.sha = sha
+
+    def get_number(self):
+        return self.number
+
+    def get_sha(self):
+        return self.sha
+
+    def get_title(self):
+        return "PR %s" % self.number
+
+    def __str__(self):
+        return "  # PR %s" % self.number
+
+
+class TestFetchPullHeads(LocalRepositoryTest):
+
+    def setUp(self):
+        LocalRepositoryTest.setUp(self)
+        self.upstream = os.path.abspath(tempfile.mkdtemp("", "upstream-"))
+        self.git("init", "-q", self.upstream)
+        self.upstream_git("config", "user.name", "scc")
+        self.upstream_git("config", "user.email", "scc@example.com")
+        self.pulls = []
+        for number in (1, 2):
+            sha = self.upstream_git(
+                "commit-tree", "-m", "PR %s" % number,
+                self.upstream_git("hash-object", "-w", "-t", "tree",
+                                  "/dev/null"))
+            self.upstream_git("update-ref", "refs/pull/%s/head" % number, sha)
+            self.pulls.append(MockPull(number, sha))
+        self.git("remote", "add", "upstream", self.upstream)
+        self.repo.remote = "upstream"
+
+    def tearDown(self):
+        try:
+            LocalRepositoryTest.tearDown(self)
+        finally:
+            shutil.rmtree(self.upstream)
+
+    def upstream_git(self, *args):
+        return self.git("--git-dir", os.path.join(self.upstream, ".git"),
+                        *args)
+
+    def testFetch(self):
+        self.assertFalse(self.repo.has_local_object(self.pulls[0].sha))
+        self.assertEqual(self.repo.fetch_pull_heads(self.pulls), [])
+        for pull in self.pulls:
+            self.assertTrue(self.repo.has_local_object(pull.sha))
+        self.assertEqual(self.repo.list_remotes(), ["origin", "upstream"])
+
+    def testMissingNamespace(self):
+        pulls = self.pulls + [MockPull(3, "0" * 40)]
+        self.assertEqual(self.repo.fetch_pull_heads(pulls), pulls)
+
+    def testLocalHeads(self):
+        self.repo.remote = "missing"
+        pulls = [MockPull(4, self.git("rev-parse", "HEAD"))]
+        self.assertEqual(self.repo.fetch_pull_heads(pulls), [])
+
+
+class MockCandidates(object):
+
+    def __init__(self, pulls):
+        self.candidate_pulls = pulls
+
+
+class PullRequestBranchTest(LocalRepositoryTest):
+    """
+    Base class for tests whose local repository contains three pull
+    request branches, the first and third of which conflict.
+    """
+
+    def setUp(self):
+        LocalRepositoryTest.setUp(self)
+        self.write("a", "base")
+        self.base = self.commit("base")
+        self.pulls = [
+            self.branch(1, "a", "one"),
+            self.branch(2, "b", "two"),
+            self.branch(3, "a", "three")]
+        self.git("checkout", "-q", "master")
+
+    def write(self, name, content):
+        f = open(os.path.join(self.path, name), "w")
+        try:
+            f.write(content + "\n")
+        finally:
+            f.close()
+        self.git("add", name)
+
+    def branch(self, number, name, content):
+        self.git("checkout", "-q", "-b", "pr%s" % number, self.base)
+        self.write(name, content)
+        return MockPull(number, self.commit("PR %s" % number))
+
+
+class TestPlanMerge(PullRequestBranchTest):
+
+    def testPlan(self):
+        clean, conflicting = self.repo.plan_merge(self.pulls)
+        self.assertEqual(clean, self.pulls[:2])
+        self.assertEqual(conflicting, self.pulls[2:])
+        self.assertEqual(self.repo.get_current_sha1(), self.base)
+        self.assertEqual(self.git("status", "--porcelain"), "")
+
+    def testPlanOrder(self):
+        clean, conflicting = self.repo.plan_merge(self.pulls[::-1])
+        self.assertEqual(conflicting, [self.pulls[0]])
+
+    def testUnknownCommit(self):
+        self.assertEqual(
+            self.repo.plan_merge([MockPull(4, "0" * 40)]), None)
+
+    def testMerge(self):
+        self.repo.origin = MockCandidates(self.pulls)
+        msg = self.repo.merge()
+        self.assertTrue("Conflicting PRs (not included):\n  # PR 3" in msg)
+        self.assertEqual(self.git("show", "HEAD:a"), "one")
+        self.assertEqual(self.git("show", "HEAD:b"), "two")
+        self.assertEqual(self.git("status", "--porcelain"), "")
+
+    def testBatchMerge(self):
+        self.repo.origin = MockCandidates(self.pulls)
+        msg = self.repo.merge()
+        history = self.git("log", "--format=%T %s")
+        self.git("reset", "-q", "--hard", self.base)
+        self.assertEqual(self.repo.merge(strategy="batch"), msg)
+        self.assertEqual(self.git("log", "--format=%T %s"), history)
+        self.assertEqual(self.git("log", "-1", "--format=%P"),
+                         "%s %s" % (self.git("rev-parse", "HEAD^"),
+                                    self.pulls[1].sha))
+        self.assertEqual(self.git("status", "--porcelain"), "")
+
+
+class MockCacheManager(object):
+
+    def __init__(self, cache):
+        self.cache = cache
+
+
+class TestConflictMatrix(PullRequestBranchTest):
+
+    def setUp(self):
+        PullRequestBranchTest.setUp(self)
+        self.git("update-ref", "refs/remotes/origin/master", self.base)
+        self.cache_path = tempfile.mkdtemp("", "cache-")
+        self.cache = DiskCache(self.cache_path)
+        self.repo.gh = MockCacheManager(self.cache)
+        self.repo.origin = MockCandidates(self.pulls)
+        self.repo.origin.user_name = "mock"
+        self.repo.origin.repo_name = "mock"
+
+    def tearDown(self):
+        self.repo.gh = None
+        try:
+            PullRequestBranchTest.tearDown(self)
+        finally:
+            shutil.rmtree(self.cache_path)
+
+    def testMatrix(self):
+        report = self.repo.conflict_matrix("master")
+        self.assertEqual(report["base_sha"], self.base)
+        self.assertEqual(report["matrix"], [[True, True, False],
+                                            [True, True, True],
+                                            [False, True, True]])
+        self.assertEqual(report["conflicts"], [[1, 3]])
+        self.assertEqual(self.repo.conflict_matrix("master", jobs=2),
+                         report)
+
+    def testBaseConflict(self):
+        self.git("checkout", "-q", "-b", "upstream", self.base)
+        self.write("a", "upstream")
+        self.git("update-ref", "refs/remotes/origin/master",
+                 self.commit("upstream"))
+        report = self.repo.conflict_matrix("master")
+        self.assertEqual(report["matrix"], [[False, None, None],
+                                            [None, True, None],
+                                            [None, None, False]])
+        self.assertEqual(report["conflicts"], [])
+
+    def testCache(self):
+        self.repo.conflict_matrix("master")
+        key = "conflicts:%s:%s:%s" % (
+            self.base, self.pulls[0].sha, self.pulls[1].sha)
+        self.assertEqual(self.cache.get(key), {"clean": True})
+        self.cache.set(key, {"clean": False})
+        report = self.repo.conflict_matrix("master")
+        self.assertEqual(report["matrix"][1][0], False)
+        self.assertEqual(report["conflicts"], [[1, 2], [1, 3]])
+
+    def testFormat(self):
+        report = self.repo.conflict_matrix("master")
+        lines = format_conflict_matrix(report)
+        self.assertEqual(lines[1:5], ["    #1 #2 #3",
+                                      " #1  .  .  X",
+                                      " #2  .  .  .",
+                                      " #3  X  .  ."])
+
+
+class TestMergeCache(PullRequestBranchTest):
+
+    def setUp(self):
+        PullRequestBranchTest.setUp(self)
+        self.cache_path = tempfile.mkdtemp("", "cache-")
+        self.repo.gh = MockCacheManager(DiskCache(self.cache_path))
+        self.repo.origin = MockCandidates(self.pulls)
+        self.repo.origin.user_name = "mock"
+        self.repo.origin.repo_name = "mock"
+        self.filters = {"base": "master"}
+
+    def tearDown(self):
+        self.repo.gh = None
+        try:
+            PullRequestBranchTest.tearDown(self)
+        finally:
+            shutil.rmtree(self.cache_path)
+
+    def merge(self, filters):
+        self.git("reset", "-q", "--hard", self.base)
+        return self.repo.merge(filters=filters), self.git("rev-parse", "HEAD")
+
+    def fail(self, *args):
+        raise AssertionError("Unexpected merge")
+
+    def testReuse(self):
+        first = self.merge(self.filters)
+        self.repo.merge_sequentially = self.fail
+        self.assertEqual(self.merge(self.filters), first)
+        self.assertEqual(self.git("status", "--porcelain"), "")
+
+    def testFingerprint(self):
+        self.merge(self.filters)
+        self.assertTrue(self.git("for-each-ref", "refs/scc/merges"))
+        self.repo.merge_sequentially = self.fail
+        self.assertRaises(AssertionError, self.merge, {"base": "develop"})
+        self.repo.origin.candidate_pulls = self.pulls[:2]
+        self.assertRaises(AssertionError, self.merge, self.filters)
+
+    def get_merge_refs(self):
+        return self.git("for-each-ref", "--format=%(refname)",
+                        "refs/scc/merges").split()
+
+    def testPruneEvicted(self):
+        self.merge(self.filters)
+        ref = self.get_merge_refs()[0]
+        self.repo.gh.cache.delete("merge:%s" % ref.rsplit("/", 1)[-1])
+        self.merge({"base": "develop"})
+        refs = self.get_merge_refs()
+        self.assertEqual(len(refs), 1)
+        self.assertFalse(ref in refs)
+
+    def testPruneOldest(self):
+        self.repo.MAX_CACHED_MERGES = 2
+        for base in ("master", "develop", "dev_4_4"):
+            self.merge({"base": base})
+        self.assertEqual(len(self.get_merge_refs()), 2)
+
+    def testCacheFailure(self):
+        def fail(key, value):
+            raise IOError("No space left on device")
+        self.repo.gh.cache.set = fail
+        msg, head = self.merge(self.filters)
+        self.assertTrue("Merged PRs:" in msg)
+        self.assertEqual(self.get_merge_refs(), [])
+
+    def testMissingRef(self):
+        first = self.merge(self.filters)
+        for ref in self.git("for-each-ref", "--format=%(refname)",
+                            "refs/scc/merges").split():
+            self.git("update-ref", "-d", ref)
+        self.assertEqual(self.merge(self.filters)[0], first[0])
+
+
+class MockRegisteredRepository(object):
+
+    def __init__(self, path, children):
+        self.path = path
+        self.children = children
+        self.jobs = None
+
+    def register_submodules(self, jobs=1):
+        time.sleep(random.random() / 50)
+        self.jobs = jobs
+
+
+class MockGHManager(object):
+
+    def __init__(self, children):
+        self.children = children
+
+    def git_repo(self, path):
+        return MockRegisteredRepository(path, self.children)
+
+
+class TestRegisterSubmodules(LocalRepositoryTest):
+
+    def tearDown(self):
+        self.repo.gh = None
+        LocalRepositoryTest.tearDown(self)
+
+    def testParallelOrder(self):
+        paths = ["sub%s" % i for i in range(8)]
+        self.repo.gh = MockGHManager([])
+        self.repo.get_submodule_paths = lambda: paths
+        self.repo.register_submodules(jobs=4)
+        self.assertEqual([x.path for x in self.repo.submodules],
+                         [os.path.join(self.path, x) for x in paths])
+        self.assertEqual([x.jobs for x in self.repo.submodules], [4] * 8)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig()
+    unittest.main()
@@ -23,6 +23,7 @@ from github.AuthenticatedUser import AuthenticatedUser
 from github.Repository import Repository
 from github.GithubException import GithubException
 from github.Issue import Issue
+from github.Organization import Organization
 from github.PullRequest import PullRequest
 from github import Github
 
@@ -131,6 +132,12 @@ class InternalRetriesHelper(object):
         self.mox.ReplayAll()
         self.fails_with(SSLError)
 
+    def testOneRateLimitError(self):
+        self.generate_errors(self.rate_limit_error, 1)
+        self.mock_calls()
+        self.mox.ReplayAll()
+        self.passes()
+
 
 class TestInternalRetries(MoxTestBase):
 
@@ -162,6 +169,16 @@ class TestInternalRetries(MoxTestBase):
         self.no_retry_exception = GithubException(-1, 'No retry')
         self.socket_timeout = socket.timeout()
         self.ssl_error = SSLError()
+        self.rate_limit_error = GithubException(
+            403, {"message": "You have exceeded a secondary rate limit"})
+
+        # Do not wait between retries
+        self.delay = GHManager.scheduler.delay
+        GHManager.scheduler.delay = 0
+
+    def tearDown(self):
+        GHManager.scheduler.delay = self.delay
+        super(TestInternalRetries, self).tearDown()
 
 
 class TestGHManagerGetUser(TestInternalRetries, InternalRetriesHelper):
@@ -197,6 +214,34 @@ class TestGHManagerGetOrganization(TestInternalRetries,
         return self.org
 
 
+class TestGHManagerGetPublicMembers(TestInternalRetries,
+                                    InternalRetriesHelper):
+
+    def setUp(self):
+        TestInternalRetries.setUp(self)
+        self.organization = self.mox.CreateMock(Organization)
+        self.organization.login = "mock"
+
+    def generate_errors(self, error, nerrors):
+        for i in range(nerrors):
+            self.organization.get_public_members().AndRaise(error)
+
+    def mock_calls(self):
+        self.organization.get_public_members().AndReturn([self.user])
+
+    def run_function(self):
+        return self.gh_manager.get_public_members(self.organization)
+
+    def get_output(self):
+        return set(["mock"])
+
+    def testCachedMembers(self):
+        self.mock_calls()
+        self.mox.ReplayAll()
+        self.passes()
+        self.passes()
+
+
 class TestGHManagerGetRepo(TestInternalRetries, InternalRetriesHelper):
 
     def generate_errors(self, error, nerrors):
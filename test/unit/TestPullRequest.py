@@ -170,6 +170,19 @@ class TestPullRequest(MoxTestBase):
         self.mox.ReplayAll()
         self.assertEquals(self.pr.get_labels(), ["mock-label", "mock-label"])
 
+    def test_get_labels_index(self):
+        self.pr.label_index = {self.pull.number: ["mock-label"]}
+        self.mox.ReplayAll()
+        self.assertEquals(self.pr.get_labels(), ["mock-label"])
+
+    def test_get_labels_index_fallback(self):
+        self.create_issue()
+        self.create_label()
+        self.issue.labels = self.labels
+        self.pr.label_index = {self.pull.number + 1: ["other-label"]}
+        self.mox.ReplayAll()
+        self.assertEquals(self.pr.get_labels(), ["mock-label"])
+
     # Comment tests
     def test_get_comments_none(self):
         self.create_issue()
@@ -179,7 +192,6 @@ class TestPullRequest(MoxTestBase):
     def test_get_comments_single(self):
         self.create_issue()
         self.create_issue_comment()
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.get_comments(), ["mock-comment"])
@@ -188,7 +200,6 @@ class TestPullRequest(MoxTestBase):
         self.create_issue()
         self.create_issue_comment("mock-comment")
         self.create_issue_comment("mock-comment")
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.get_comments(),
@@ -203,7 +214,6 @@ class TestPullRequest(MoxTestBase):
         self.create_issue_comment("mock-comment-1", user=org_user_1)
         self.create_issue_comment("mock-comment-2", user=ext_user)
         self.create_issue_comment("mock-comment-3", user=org_user_2)
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         org.has_in_public_members(org_user_1).AndReturn(True)
         org.has_in_public_members(ext_user).AndReturn(False)
@@ -213,12 +223,46 @@ class TestPullRequest(MoxTestBase):
         self.assertEquals(self.pr.get_comments(whitelist=whitelist),
                           ["mock-comment-1", "mock-comment-3"])
 
+    def test_get_comments_cached(self):
+        self.create_issue()
+        self.create_label()
+        self.issue.labels = self.labels
+        self.create_issue_comment("mock-comment")
+        self.issue.get_comments().AndReturn(self.comments)
+        self.mox.ReplayAll()
+        self.assertEquals(self.pr.get_labels(), ["mock-label"])
+        self.assertEquals(self.pr.get_comments(), ["mock-comment"])
+        self.assertEquals(self.pr.get_comments(), ["mock-comment"])
+        self.assertEquals(self.pr.get_comments(whitelist=lambda x: False),
+                          [])
+        self.assertEquals(self.pr.get_labels(), ["mock-label"])
+
+    def test_invalidate(self):
+        self.create_issue()
+        self.create_issue()
+        self.mox.ReplayAll()
+        self.assertEquals(self.pr.get_comments(), [])
+        self.pr.invalidate()
+        self.assertEquals(self.pr.get_comments(), [])
+
     def test_create_issue_comment(self):
         comment = self.mox.CreateMock(IssueComment)
         self.pull.create_issue_comment("comment").AndReturn(comment)
         self.mox.ReplayAll()
         self.assertEqual(self.pr.create_issue_comment("comment"), comment)
 
+    def test_create_issue_comment_invalidate(self):
+        comment = self.mox.CreateMock(IssueComment)
+        self.create_issue()
+        self.pull.create_issue_comment("comment").AndReturn(comment)
+        self.create_issue()
+        self.create_issue_comment("comment")
+        self.issue.get_comments().AndReturn(self.comments)
+        self.mox.ReplayAll()
+        self.assertEquals(self.pr.get_comments(), [])
+        self.pr.create_issue_comment("comment")
+        self.assertEquals(self.pr.get_comments(), ["comment"])
+
     # Commit/status tests
     def test_get_sha(self):
         self.pull.head.sha = "mock-sha"
@@ -337,7 +381,6 @@ class TestPullRequest(MoxTestBase):
         match = '-match1'
         self.create_issue()
         self.create_issue_comment("--%s%s\n" % (pattern, match))
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.parse_comments(pattern), [match])
@@ -350,7 +393,6 @@ class TestPullRequest(MoxTestBase):
         self.create_issue()
         self.create_issue_comment("--%s%s\n--%s%s\n"
                                   % (pattern1, match1, pattern2, match2))
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.parse_comments([pattern1, pattern2]),
@@ -364,7 +406,6 @@ class TestPullRequest(MoxTestBase):
         self.create_issue()
         self.create_issue_comment("--%s%s\n" % (pattern1, match1))
         self.create_issue_comment("--%s%s\n" % (pattern2, match2))
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.parse_comments([pattern1, pattern2]),
@@ -387,7 +428,6 @@ class TestPullRequest(MoxTestBase):
         match = '-match'
         self.create_issue()
         self.create_issue_comment("--%s%s\n" % (pattern, match))
-        self.base_repo.get_issue(self.pull.number).AndReturn(self.issue)
         self.issue.get_comments().AndReturn(self.comments)
         self.mox.ReplayAll()
         self.assertEquals(self.pr.parse(pattern), [match])
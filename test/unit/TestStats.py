@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2013 University of Dundee & Open Microscopy Environment
+# All Rights Reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import json
+import logging
+import tempfile
+import unittest
+
+from scc.stats import get_endpoint, percentile, RequestStats
+
+
+class UnitTestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = RequestStats()
+        self.stats.command = "merge"
+
+    def headers(self, remaining, reset=1000, limit=5000):
+        return {"x-ratelimit-limit": str(limit),
+                "x-ratelimit-remaining": str(remaining),
+                "x-ratelimit-reset": str(reset)}
+
+    def testEndpoint(self):
+        self.assertEqual(
+            get_endpoint("GET", "/repos/mock/mock/pulls/12/comments?page=2"),
+            ("mock/mock", "GET /pulls/:number/comments"))
+        self.assertEqual(
+            get_endpoint("GET", "https://api.github.com/repos/mock/mock/"
+                         "commits/%s/status" % ("a" * 40)),
+            ("mock/mock", "GET /commits/:sha/status"))
+        self.assertEqual(get_endpoint("GET", "/user"), (None, "GET /user"))
+
+    def testPercentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile([3], 0.95), 3)
+        self.assertEqual(percentile([], 0.5), None)
+
+    def testSummary(self):
+        for i in range(4):
+            self.stats.record("GET", "/repos/mock/mock/pulls/%s" % i,
+                              0.1 * (i + 1), cached=(i == 0),
+                              headers=self.headers(100 - i))
+        self.stats.record("GET", "/user", 0.5)
+        self.stats.record_retry("get_pulls")
+        summary = self.stats.get_summary()
+        self.assertEqual(len(summary["endpoints"]), 2)
+        entry = summary["endpoints"][1]
+        self.assertEqual(entry["endpoint"], "GET /pulls/:number")
+        self.assertEqual(entry["repository"], "mock/mock")
+        self.assertEqual(entry["command"], "merge")
+        self.assertEqual(entry["calls"], 4)
+        self.assertEqual(entry["cached"], 1)
+        self.assertAlmostEqual(entry["p50"], 0.2)
+        self.assertAlmostEqual(entry["p95"], 0.4)
+        self.assertEqual(summary["retries"], [
+            {"command": "merge", "function": "get_pulls", "retries": 1}])
+        self.assertEqual(summary["quota_used"], 3)
+        self.assertEqual(len(self.stats.format_summary(summary)), 6)
+
+    def testQuotaReset(self):
+        self.stats.update_quota(self.headers(10))
+        self.stats.update_quota(self.headers(4990, reset=2000))
+        self.assertEqual(self.stats.quota_used, 10)
+
+    def testReport(self):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            self.stats.record("GET", "/user", 0.5)
+            self.stats.report(filename)
+            f = open(filename)
+            try:
+                summary = json.load(f)
+            finally:
+                f.close()
+            self.assertEqual(summary["endpoints"][0]["calls"], 1)
+        finally:
+            os.remove(filename)
+
+    def testReportLogging(self):
+        messages = []
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                messages.append((record.levelno, record.getMessage()))
+        handler = Handler()
+        level = self.stats.log.level
+        self.stats.log.addHandler(handler)
+        self.stats.log.setLevel(logging.INFO)
+        try:
+            self.stats.record("GET", "/user", 0.5)
+            self.stats.report(None)
+        finally:
+            self.stats.log.removeHandler(handler)
+            self.stats.log.setLevel(level)
+        self.assertEqual(messages[0], (logging.INFO, "GitHub API calls:"))
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    unittest.main()